@@ -0,0 +1,355 @@
+# backend/app/core/contraction.py
+# Customizable contraction hierarchy (CCH) over graph_manager's CSR graph.
+# The expensive part, contracting nodes in a fixed order and recording which shortcuts that creates, only
+# depends on the topology and runs once per map. Travel times change all the time, so shortcut weights are
+# "customized" separately: one pass over the recorded triangles, redone whenever the weights change.
+# Queries are then two small upward searches that meet at the highest node of the shortest path.
+import logging
+import numpy as np
+from dataclasses import dataclass
+from itertools import chain
+from typing import Optional
+from app.core.dijkstra_nb import njit
+
+logger = logging.getLogger(__name__)
+
+# Size caps: customization walks every triangle once per route epoch, and the triangles are kept for the
+# lifetime of the map (12 bytes each). Above either cap, build returns None and routing uses A* instead.
+MAX_CONTRACTION_NODES = 20_000
+MAX_CONTRACTION_TRIANGLES = 6_000_000
+
+
+@dataclass
+class ContractionHierarchy:
+    """
+    Arcs join a lower-ranked node arc_low[a] to a higher-ranked one arc_high[a]; arcs up_row_ptr[v]:up_row_ptr[v+1]
+    are the ones whose lower end is v. A triangle t means arcs tri_vu[t] = {v, u} and tri_vw[t] = {v, w}, with v
+    ranked below u below w, together form a path that arc tri_uw[t] = {u, w} is a shortcut for (int32 arc ids,
+    as there are far more triangles than arcs).
+    """
+    rank: np.ndarray
+    up_row_ptr: np.ndarray
+    arc_low: np.ndarray
+    arc_high: np.ndarray
+    edge_arc: np.ndarray # Arc carrying each original edge, -1 for self-loops
+    edge_is_up: np.ndarray # Whether the edge runs from the arc's lower end to its higher end
+    tri_vu: np.ndarray
+    tri_vw: np.ndarray
+    tri_uw: np.ndarray
+
+
+def build(n: int, edge_src: np.ndarray, edge_dst: np.ndarray) -> Optional[ContractionHierarchy]:
+    """
+    Contracts nodes on the undirected graph in nested dissection order (see _dissection_order), so the
+    shortcut structure holds for any edge weights. None if the map is too big for a hierarchy (see the caps).
+    """
+    if n > MAX_CONTRACTION_NODES:
+        logger.info("No contraction hierarchy for %d nodes (cap %d); routing uses A*.", n, MAX_CONTRACTION_NODES)
+        return None
+    adjacency = [set() for _ in range(n)]
+    for u, v in zip(edge_src.tolist(), edge_dst.tolist()):
+        if u != v:
+            adjacency[u].add(v)
+            adjacency[v].add(u)
+
+    rank = np.full(n, -1, dtype=np.int64)
+    upward = [None] * n # Neighbours of each node still uncontracted when it was contracted, i.e. ranked higher
+    for next_rank, v in enumerate(_dissection_order(adjacency)):
+        rank[v] = next_rank
+        neighbours = adjacency[v]
+        upward[v] = list(neighbours)
+        for u in neighbours: # Contracting v joins all of its neighbours to each other
+            adjacency[u] |= neighbours
+            adjacency[u].discard(u)
+            adjacency[u].discard(v)
+        adjacency[v] = set()
+
+    # Arcs grouped by lower end; each node's upward neighbours are sorted by rank, so arcs can be found by
+    # binary search (_find_arc) and triangles come out u < w
+    rank_of = rank.tolist()
+    for v in range(n):
+        upward[v].sort(key=rank_of.__getitem__)
+    up_degree = np.fromiter(map(len, upward), dtype=np.int64, count=n)
+    up_row_ptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(up_degree, out=up_row_ptr[1:])
+    n_triangles = int(np.sum(up_degree * (up_degree - 1) // 2)) # Every pair of a node's upward arcs
+    if n_triangles > MAX_CONTRACTION_TRIANGLES:
+        logger.info(
+            "No contraction hierarchy: %d shortcut triangles (cap %d); routing uses A*.", n_triangles, MAX_CONTRACTION_TRIANGLES
+        )
+        return None
+    arc_high = np.fromiter(chain.from_iterable(upward), dtype=np.int64, count=int(up_row_ptr[-1]))
+
+    tri_vu, tri_vw, tri_uw = _triangles(np.argsort(rank), up_row_ptr, arc_high, rank, n_triangles)
+    edge_arc, edge_is_up = _edge_arcs(up_row_ptr, arc_high, rank, edge_src, edge_dst)
+    return ContractionHierarchy(
+        rank=rank, up_row_ptr=up_row_ptr, arc_low=np.repeat(np.arange(n, dtype=np.int64), up_degree),
+        arc_high=arc_high, edge_arc=edge_arc, edge_is_up=edge_is_up, tri_vu=tri_vu, tri_vw=tri_vw, tri_uw=tri_uw,
+    )
+
+
+@njit(cache=True, nogil=True)
+def _find_arc(up_row_ptr, arc_high, rank, low, high, first):
+    """Arc from low up to high, searching low's arcs from index first on (binary search by rank), or -1."""
+    lo, hi = first, up_row_ptr[low + 1]
+    target = rank[high]
+    while lo < hi:
+        mid = (lo + hi) >> 1
+        if rank[arc_high[mid]] < target:
+            lo = mid + 1
+        else:
+            hi = mid
+    if lo < up_row_ptr[low + 1] and arc_high[lo] == high:
+        return lo
+    return -1
+
+
+@njit(cache=True, nogil=True)
+def _triangles(order, up_row_ptr, arc_high, rank, count):
+    """
+    Every triangle as int32 arc ids, in rank order of their lowest node: customization relies on an arc being
+    final before it is used. Contracting v made its upward neighbours a clique, so arc {u, w} always exists.
+    """
+    tri_vu = np.empty(count, dtype=np.int32)
+    tri_vw = np.empty(count, dtype=np.int32)
+    tri_uw = np.empty(count, dtype=np.int32)
+    t = 0
+    for v in order:
+        end = up_row_ptr[v + 1]
+        for a_vu in range(up_row_ptr[v], end):
+            u = arc_high[a_vu]
+            search_from = up_row_ptr[u] # The w come in rank order, and so do their arcs from u
+            for a_vw in range(a_vu + 1, end):
+                a_uw = _find_arc(up_row_ptr, arc_high, rank, u, arc_high[a_vw], search_from)
+                tri_vu[t] = a_vu
+                tri_vw[t] = a_vw
+                tri_uw[t] = a_uw
+                search_from = a_uw + 1
+                t += 1
+    return tri_vu, tri_vw, tri_uw
+
+
+@njit(cache=True, nogil=True)
+def _edge_arcs(up_row_ptr, arc_high, rank, edge_src, edge_dst):
+    """Arc carrying each edge (-1 for self-loops), and whether the edge runs up it."""
+    m = edge_src.shape[0]
+    edge_arc = np.full(m, -1, dtype=np.int64)
+    edge_is_up = np.zeros(m, dtype=np.bool_)
+    for e in range(m):
+        u, v = edge_src[e], edge_dst[e]
+        if u == v:
+            continue
+        if rank[u] < rank[v]:
+            edge_arc[e] = _find_arc(up_row_ptr, arc_high, rank, u, v, up_row_ptr[u])
+            edge_is_up[e] = True
+        else:
+            edge_arc[e] = _find_arc(up_row_ptr, arc_high, rank, v, u, up_row_ptr[v])
+    return edge_arc, edge_is_up
+
+
+def _dissection_order(adjacency):
+    """
+    Contraction order, lowest rank first. Each connected part is split in two by the nodes at the median
+    distance from a far-away node; those separator nodes are ranked above both halves, which are ordered the
+    same way. Searches then only climb through a few separators instead of across the whole map.
+    """
+    order = []
+    # Each entry is a node set to order, or a finished list of separator nodes to emit once the halves are done
+    pending = [set(range(len(adjacency)))]
+    while pending:
+        part = pending.pop()
+        if isinstance(part, list):
+            order.extend(part)
+            continue
+        if len(part) <= 4:
+            order.extend(part)
+            continue
+        start = next(iter(part))
+        component = _bfs_levels(adjacency, part, start)
+        if len(component) < len(part): # Disconnected: the components are independent
+            pending.append(part - component.keys())
+            pending.append(set(component))
+            continue
+        far = max(component, key=component.get)
+        levels = _bfs_levels(adjacency, part, far)
+        by_level = np.bincount(np.fromiter(levels.values(), dtype=np.int64, count=len(levels)))
+        median = int(np.searchsorted(np.cumsum(by_level), len(part) // 2))
+        separator = [v for v, level in levels.items() if level == median]
+        if len(separator) == len(part):
+            order.extend(separator)
+            continue
+        pending.append(separator)
+        pending.append({v for v, level in levels.items() if level < median})
+        pending.append({v for v, level in levels.items() if level > median})
+    return order
+
+
+def _bfs_levels(adjacency, part, start):
+    """Hop distance from start to every node reachable from it without leaving part."""
+    levels = {start: 0}
+    frontier = [start]
+    level = 0
+    while frontier:
+        level += 1
+        next_frontier = []
+        for u in frontier:
+            for v in adjacency[u]:
+                if v in part and v not in levels:
+                    levels[v] = level
+                    next_frontier.append(v)
+        frontier = next_frontier
+    return levels
+
+
+def customize(hierarchy: ContractionHierarchy, weights: np.ndarray):
+    """Shortcut weights for the given edge weights: (up, down, up_via, down_via), see _customize."""
+    return _customize(
+        len(hierarchy.arc_high), hierarchy.edge_arc, hierarchy.edge_is_up, weights,
+        hierarchy.tri_vu, hierarchy.tri_vw, hierarchy.tri_uw
+    )
+
+
+@njit(cache=True, nogil=True)
+def _customize(n_arcs, edge_arc, edge_is_up, weights, tri_vu, tri_vw, tri_uw):
+    """
+    up[a] is the cheapest way from the arc's lower end to its higher end, down[a] the other way round.
+    up_via/down_via hold the triangle that produced the value, or -1 where it is an original edge.
+    """
+    up = np.full(n_arcs, np.inf)
+    down = np.full(n_arcs, np.inf)
+    up_via = np.full(n_arcs, -1, dtype=np.int64)
+    down_via = np.full(n_arcs, -1, dtype=np.int64)
+    for e in range(weights.shape[0]):
+        a = edge_arc[e]
+        if a < 0:
+            continue
+        if edge_is_up[e]:
+            up[a] = min(up[a], weights[e])
+        else:
+            down[a] = min(down[a], weights[e])
+    for t in range(tri_uw.shape[0]):
+        a_vu, a_vw, a_uw = tri_vu[t], tri_vw[t], tri_uw[t]
+        cost = down[a_vu] + up[a_vw] # u -> v -> w
+        if cost < up[a_uw]:
+            up[a_uw] = cost
+            up_via[a_uw] = t
+        cost = down[a_vw] + up[a_vu] # w -> v -> u
+        if cost < down[a_uw]:
+            down[a_uw] = cost
+            down_via[a_uw] = t
+    return up, down, up_via, down_via
+
+
+def shortest_path(hierarchy: ContractionHierarchy, metric, src: int, dst: int):
+    """(path, cost) like dijkstra_csr: node indices from src to dst, or an empty array and inf if unreachable."""
+    up, down, up_via, down_via = metric
+    return _query(
+        hierarchy.up_row_ptr, hierarchy.arc_low, hierarchy.arc_high, up, down, up_via, down_via,
+        hierarchy.tri_vu, hierarchy.tri_vw, src, dst
+    )
+
+
+@njit(cache=True, nogil=True)
+def _upward_search(up_row_ptr, arc_high, arc_weights, src):
+    """
+    Shortest distances from src over upward arcs only. Everything reachable that way is an ancestor of src in
+    the elimination tree (parent = lowest-ranked upward neighbour), so walking that chain in rank order and
+    relaxing each node's arcs settles them without a heap. Returns (dist, arc each node was reached by).
+    """
+    n = up_row_ptr.shape[0] - 1
+    dist = np.full(n, np.inf)
+    via_arc = np.full(n, -1, dtype=np.int64)
+    dist[src] = 0.0
+    v = src
+    while True:
+        first, end = up_row_ptr[v], up_row_ptr[v + 1]
+        if dist[v] < np.inf:
+            for a in range(first, end):
+                w = arc_high[a]
+                nd = dist[v] + arc_weights[a]
+                if nd < dist[w]:
+                    dist[w] = nd
+                    via_arc[w] = a
+        if first == end: # Root of the elimination tree
+            break
+        v = arc_high[first]
+    return dist, via_arc
+
+
+@njit(cache=True, nogil=True)
+def _query(up_row_ptr, arc_low, arc_high, up, down, up_via, down_via, tri_vu, tri_vw, src, dst):
+    # Forward search climbs from src on up weights; backward climbs from dst on down weights,
+    # i.e. finds paths from higher nodes down to dst. The best meeting node is on the shortest path,
+    # and it is a common ancestor of both, so only src's ancestors need checking.
+    forward, forward_arc = _upward_search(up_row_ptr, arc_high, up, src)
+    backward, backward_arc = _upward_search(up_row_ptr, arc_high, down, dst)
+    meet = -1
+    cost = np.inf
+    v = src
+    while True:
+        if forward[v] + backward[v] < cost:
+            cost = forward[v] + backward[v]
+            meet = v
+        if up_row_ptr[v] == up_row_ptr[v + 1]:
+            break
+        v = arc_high[up_row_ptr[v]]
+    if meet < 0:
+        return np.empty(0, dtype=np.int64), np.inf
+
+    # Arcs to unpack, in path order; direction 1 is low -> high (up), 0 is high -> low (down).
+    # Kept as a stack, so push the path back to front: dst's side first, then src's side.
+    stack_arc = np.empty(2 * arc_high.shape[0] + 2, dtype=np.int64)
+    stack_up = np.empty(2 * arc_high.shape[0] + 2, dtype=np.bool_)
+    size = 0
+    backward_chain = np.empty(up_row_ptr.shape[0], dtype=np.int64)
+    chain_len = 0
+    v = meet
+    while v != dst:
+        a = backward_arc[v]
+        backward_chain[chain_len] = a
+        chain_len += 1
+        v = arc_low[a]
+    for i in range(chain_len - 1, -1, -1):
+        stack_arc[size] = backward_chain[i]
+        stack_up[size] = False
+        size += 1
+    v = meet
+    while v != src:
+        a = forward_arc[v]
+        stack_arc[size] = a
+        stack_up[size] = True
+        size += 1
+        v = arc_low[a]
+
+    path = np.empty(up_row_ptr.shape[0], dtype=np.int64)
+    path[0] = src
+    count = 1
+    while size > 0:
+        size -= 1
+        a = stack_arc[size]
+        going_up = stack_up[size]
+        t = up_via[a] if going_up else down_via[a]
+        if t < 0: # Original road: step to its other end
+            if count == path.shape[0]:
+                grown = np.empty(2 * count, dtype=np.int64)
+                grown[:count] = path
+                path = grown
+            path[count] = arc_high[a] if going_up else arc_low[a]
+            count += 1
+            continue
+        if size + 2 > stack_arc.shape[0]:
+            grown_arc = np.empty(2 * stack_arc.shape[0], dtype=np.int64)
+            grown_up = np.empty(2 * stack_arc.shape[0], dtype=np.bool_)
+            grown_arc[:size] = stack_arc[:size]
+            grown_up[:size] = stack_up[:size]
+            stack_arc, stack_up = grown_arc, grown_up
+        # Shortcut through the triangle's lowest node v: up is u -> v -> w, down is w -> v -> u.
+        # Push the second half first so the first half is unpacked next.
+        if going_up:
+            stack_arc[size], stack_up[size] = tri_vw[t], True # v -> w
+            stack_arc[size + 1], stack_up[size + 1] = tri_vu[t], False # u -> v
+        else:
+            stack_arc[size], stack_up[size] = tri_vu[t], True # v -> u
+            stack_arc[size + 1], stack_up[size + 1] = tri_vw[t], False # w -> v
+        size += 2
+    return path[:count].copy(), cost
@@ -0,0 +1,129 @@
+# backend/app/core/dijkstra_nb.py
+# Shortest-path kernels over the CSR arrays kept by graph_manager, compiled with Numba. They release
+# the GIL (nogil), so searches started from worker threads run in parallel.
+import numpy as np
+
+try:
+    from numba import njit
+    HAVE_NUMBA = True
+except ImportError: # Without numba the kernels still run, as plain (much slower) Python
+    HAVE_NUMBA = False
+
+    def njit(*args, **kwargs):
+        if args and callable(args[0]):
+            return args[0]
+        return lambda fn: fn
+
+
+@njit(cache=True, nogil=True)
+def _heap_push(heap_keys, heap_vals, size, key, val):
+    """Pushes (key, val) onto the binary min-heap stored in the first `size` slots. Returns the new size."""
+    i = size
+    while i > 0:
+        parent = (i - 1) >> 1
+        if heap_keys[parent] <= key:
+            break
+        heap_keys[i] = heap_keys[parent]
+        heap_vals[i] = heap_vals[parent]
+        i = parent
+    heap_keys[i] = key
+    heap_vals[i] = val
+    return size + 1
+
+
+@njit(cache=True, nogil=True)
+def _heap_pop(heap_keys, heap_vals, size):
+    """Removes the root of the heap (read heap_keys[0]/heap_vals[0] first). Returns the new size."""
+    size -= 1
+    key = heap_keys[size]
+    val = heap_vals[size]
+    i = 0
+    while True:
+        child = 2 * i + 1
+        if child >= size:
+            break
+        if child + 1 < size and heap_keys[child + 1] < heap_keys[child]:
+            child += 1
+        if key <= heap_keys[child]:
+            break
+        heap_keys[i] = heap_keys[child]
+        heap_vals[i] = heap_vals[child]
+        i = child
+    heap_keys[i] = key
+    heap_vals[i] = val
+    return size
+
+
+@njit(cache=True, nogil=True)
+def _dijkstra(row_ptr, col_idx, weights, src, dst, positions, h_scale):
+    """
+    Heap Dijkstra from src returning (dist, prev, settled). Stops once dst is settled; pass dst=-1 to settle everything.
+    With h_scale > 0 it runs as A*: nodes are keyed by dist + h_scale * euclid(node, dst), which must never
+    overestimate the remaining travel time (see graph_manager.HEURISTIC_SCALE).
+    """
+    n = row_ptr.shape[0] - 1
+    dist = np.full(n, np.inf)
+    prev = np.full(n, -1, dtype=np.int64)
+    settled = np.zeros(n, dtype=np.bool_)
+    # Lazy deletion pushes at most one entry per relaxed edge, plus the source
+    heap_keys = np.empty(col_idx.shape[0] + 1, dtype=np.float64)
+    heap_vals = np.empty(col_idx.shape[0] + 1, dtype=np.int64)
+
+    use_heuristic = h_scale > 0.0 and dst >= 0
+    dist[src] = 0.0
+    size = _heap_push(heap_keys, heap_vals, 0, 0.0, src)
+    while size > 0:
+        u = heap_vals[0]
+        size = _heap_pop(heap_keys, heap_vals, size)
+        if settled[u]:
+            continue
+        settled[u] = True
+        if u == dst:
+            break
+        d = dist[u]
+        for e in range(row_ptr[u], row_ptr[u + 1]):
+            v = col_idx[e]
+            nd = d + weights[e]
+            if nd < dist[v]:
+                dist[v] = nd
+                prev[v] = u
+                key = nd
+                if use_heuristic:
+                    key += h_scale * np.hypot(positions[v, 0] - positions[dst, 0], positions[v, 1] - positions[dst, 1])
+                size = _heap_push(heap_keys, heap_vals, size, key, v)
+    return dist, prev, settled
+
+
+@njit(cache=True, nogil=True)
+def dijkstra_csr(row_ptr, col_idx, weights, src, dst, positions, h_scale):
+    """
+    Single-pair search (A* when h_scale > 0). Returns (path, cost) where path is an array of node indices
+    from src to dst, or an empty array and inf when dst is unreachable.
+    """
+    dist, prev, settled = _dijkstra(row_ptr, col_idx, weights, src, dst, positions, h_scale)
+    if not settled[dst]:
+        return np.empty(0, dtype=np.int64), np.inf
+
+    # Walk prev back from dst to size the path, then fill it in reverse
+    count = 1
+    v = dst
+    while v != src:
+        v = prev[v]
+        count += 1
+    path = np.empty(count, dtype=np.int64)
+    v = dst
+    for i in range(count - 1, -1, -1):
+        path[i] = v
+        v = prev[v]
+    return path, dist[dst]
+
+
+@njit(cache=True, nogil=True)
+def sssp_csr(row_ptr, col_idx, weights, src):
+    """
+    Full single-source Dijkstra (no early exit). Returns (dist, prev) for every node; prev[v] is -1 for
+    src and for unreachable nodes. Run on the reverse CSR it gives distances *to* src, with prev[v]
+    being the next hop from v towards src.
+    """
+    dist, prev, _ = _dijkstra(row_ptr, col_idx, weights, src, -1, np.empty((0, 2)), 0.0)
+    return dist, prev
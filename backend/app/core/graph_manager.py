@@ -1,160 +1,405 @@
-import networkx as nx
+import logging
+import threading
+import numpy as np
+from dataclasses import dataclass
+from itertools import chain
 from typing import List, Dict, Tuple, Optional
-from app.models import CityMap, Node as ModelNode, Edge as ModelEdge
+from app.core import contraction
+from app.core.dijkstra_nb import HAVE_NUMBA
+from app.models import CityMap, Edge as ModelEdge
 
-CITY_GRAPH = nx.DiGraph()
-ROAD_DATA: Dict[Tuple[str, str], Dict] = {} # (source, target) -> {data}
+logger = logging.getLogger(__name__)
+
+# The topology never changes after load_map, so the graph is kept as flat CSR arrays
+# instead of a dict-of-dicts: edge ids ROW_PTR[i]:ROW_PTR[i+1] leave node i, COL_IDX[e] is the target of edge e.
+NAME_TO_IDX: Dict[str, int] = {} # node id -> dense integer index
+IDX_TO_NAME: List[str] = []
+NODE_POSITIONS = np.zeros((0, 2), dtype=np.float64) # (x, y) per node index, NaN where the map gives none
+# Seconds per unit of straight-line distance that no road beats, so HEURISTIC_SCALE * euclid(n, dst) never
+# overestimates the travel time left (travel times only grow above base). 0 disables the A* heuristic.
+HEURISTIC_SCALE: float = 0.0
+ROW_PTR = np.zeros(1, dtype=np.int64)
+COL_IDX = np.zeros(0, dtype=np.int64)
+EDGE_SRC = np.zeros(0, dtype=np.int64) # Source node of each edge (the "row" of edge e)
+# Reverse CSR: edge ids IN_EDGE_IDX[IN_ROW_PTR[i]:IN_ROW_PTR[i+1]] enter node i
+IN_ROW_PTR = np.zeros(1, dtype=np.int64)
+IN_EDGE_IDX = np.zeros(0, dtype=np.int64)
+IN_COL_IDX = np.zeros(0, dtype=np.int64) # Source node of each IN_EDGE_IDX entry, i.e. the reverse graph's targets
+EDGE_INDEX: Dict[Tuple[str, str], int] = {} # (source, target) -> edge id
+EDGE_ID_STR: List[str] = [] # "source-target" road id of each edge, built once for API output
+ROAD_ID_INDEX: Dict[str, int] = {} # "source-target" road id -> edge id, so API road ids are never split
+EDGE_ROADS: List[Tuple[str, str]] = [] # (source, target) of each edge
+# IN_EDGE_IDX split per node as plain lists (edge ids entering each node), for per-intersection lookups
+EDGES_ENTERING: List[List[int]] = []
+
+# Per-edge road state as parallel arrays indexed by edge id
+BASE_TRAVEL_TIME = np.zeros(0, dtype=np.float64)
+CAPACITY = np.zeros(0, dtype=np.int64)
+CURRENT_CONGESTION = np.zeros(0, dtype=np.float64)
+CURRENT_VEHICLES = np.zeros(0, dtype=np.int64)
+CURRENT_TRAVEL_TIME = np.zeros(0, dtype=np.float64) # Edge weights used for routing
+# Per node: whether the vehicle count of some road entering it changed since traffic_light_service last looked
+INCOMING_COUNT_CHANGED = np.zeros(0, dtype=bool)
+WEIGHTS_EPOCH: int = 0 # Bumped whenever any edge weight changes (or a new map is loaded)
+TRAFFIC_VERSION: int = 0 # Bumped whenever any road's count, congestion or travel time may have changed
+# Coarser epoch keying the route cache: only bumped once some edge's travel time has moved more than
+# ROUTE_EPOCH_TOLERANCE (relative) away from what it was at the previous bump, so small count changes
+# every tick don't throw away every cached route.
+ROUTE_EPOCH: int = 0
+ROUTE_EPOCH_TOLERANCE = 0.05
+_ROUTE_EPOCH_WEIGHTS = np.zeros(0, dtype=np.float64) # CURRENT_TRAVEL_TIME as of the last ROUTE_EPOCH bump
+
+# Double-buffered weights: writers mutate CURRENT_TRAVEL_TIME (the staging buffer) under _WEIGHTS_LOCK, readers
+# go through current_weights(), which hands out a read-only (weights, epoch) pair published at most once per epoch.
+# Swapping the tuple is a single reference store, so a reader never sees weights from one epoch tagged with another.
+_WEIGHTS_LOCK = threading.RLock()
+_PUBLISHED_WEIGHTS: Tuple[np.ndarray, int] = (CURRENT_TRAVEL_TIME, -1)
+
+# Contraction hierarchy of the current map (None without numba, where customizing it in plain Python is too
+# slow, or above contraction's size caps), and its shortcut weights as customized for a ROUTE_EPOCH
+CONTRACTION: Optional[contraction.ContractionHierarchy] = None
+_CONTRACTION_METRIC: Tuple[int, Optional[tuple]] = (-1, None)
+# current_weights() as of the first route search in a ROUTE_EPOCH: every search in the epoch uses these
+_ROUTE_WEIGHTS: Tuple[int, np.ndarray] = (-1, CURRENT_TRAVEL_TIME)
+_CUSTOMIZE_LOCK = threading.Lock() # Held while customizing, so each epoch is customized once; never inside _WEIGHTS_LOCK
+
+@dataclass
+class PreparedMap:
+    """Everything load_map derives from a CityMap, built by prepare_map without touching the loaded map."""
+    name_to_idx: Dict[str, int]
+    node_positions: np.ndarray
+    row_ptr: np.ndarray
+    edge_src: np.ndarray
+    col_idx: np.ndarray
+    in_row_ptr: np.ndarray
+    in_edge_idx: np.ndarray
+    edges_entering: List[List[int]]
+    base_travel_time: np.ndarray
+    capacity: np.ndarray
+    heuristic_scale: float
+    contraction: Optional[contraction.ContractionHierarchy]
+    base_metric: Optional[tuple] # contraction customized to base_travel_time, the weights of an empty map
 
 def load_map(city_map: CityMap):
-    global CITY_GRAPH, ROAD_DATA
-    CITY_GRAPH.clear()
-    ROAD_DATA.clear()
+    return install_map(prepare_map(city_map))
 
-    for node_data in city_map.nodes:
-        CITY_GRAPH.add_node(node_data.id, name=node_data.name, x=node_data.x, y=node_data.y)
+def prepare_map(city_map: CityMap) -> PreparedMap:
+    """
+    The CPU-heavy part of loading a map (CSR arrays, contraction hierarchy). It only reads city_map, so it
+    can run in a worker thread while the current map stays in use; install_map then swaps the result in.
+    """
+    # One dict-comprehension pass each for edges and nodes instead of per-edge setdefault bookkeeping.
+    # A repeated (source, target) pair overrides the earlier one, and unknown endpoints become nodes.
+    edges: Dict[Tuple[str, str], ModelEdge] = {(e.source, e.target): e for e in city_map.edges}
+    node_order = dict.fromkeys(node_data.id for node_data in city_map.nodes)
+    node_order.update(dict.fromkeys(chain.from_iterable(edges)))
+    name_to_idx: Dict[str, int] = {node_id: i for i, node_id in enumerate(node_order)}
+    positions = {name_to_idx[node_data.id]: (node_data.x, node_data.y) for node_data in city_map.nodes}
 
-    for edge_data in city_map.edges:
-        source, target = edge_data.source, edge_data.target
-        base_time = edge_data.base_travel_time
-        capacity = edge_data.capacity
+    n, m = len(name_to_idx), len(edges)
+    src_names, dst_names = zip(*edges) if edges else ((), ())
+    src = np.fromiter(map(name_to_idx.__getitem__, src_names), dtype=np.int64, count=m)
+    dst = np.fromiter(map(name_to_idx.__getitem__, dst_names), dtype=np.int64, count=m)
+    base_time = np.fromiter((e.base_travel_time for e in edges.values()), dtype=np.float64, count=m)
+    capacity = np.fromiter((e.capacity or 100 for e in edges.values()), dtype=np.int64, count=m) # Default capacity if not provided
 
-        # Add edge with initial travel time same as base_travel_time
-        CITY_GRAPH.add_edge(source, target, base_travel_time=base_time, current_travel_time=base_time)
-        ROAD_DATA[(source, target)] = {
-            "base_travel_time": base_time,
-            "capacity": capacity or 100, # Default capacity if not provided
-            "current_congestion": 0.0,
-            "current_vehicles": 0 # Initialize vehicle count
-        }
-    print(f"Map loaded: {CITY_GRAPH.number_of_nodes()} nodes, {CITY_GRAPH.number_of_edges()} edges.")
-    return True
+    # Count out-degrees and prefix-sum them into ROW_PTR; a stable sort by source gives the CSR edge order
+    order = np.argsort(src, kind="stable")
+    row_ptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=n), out=row_ptr[1:])
+    in_row_ptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(dst, minlength=n), out=in_row_ptr[1:])
+
+    node_positions = np.full((n, 2), np.nan)
+    for node_idx, (x, y) in positions.items():
+        node_positions[node_idx] = (np.nan if x is None else x, np.nan if y is None else y)
+    edge_src, col_idx, base_time = src[order], dst[order], base_time[order]
+    in_edge_idx = np.argsort(col_idx, kind="stable")
+    in_edges, in_bounds = in_edge_idx.tolist(), in_row_ptr.tolist()
+    # Edge weights only come in at customization, so the hierarchy is built once per topology. Customizing it
+    # here for the empty map (and running one query) also loads the numba kernels, so the first route request
+    # after the swap doesn't pay for either while holding the weights lock.
+    hierarchy = contraction.build(n, edge_src, col_idx) if HAVE_NUMBA else None
+    base_metric = None
+    if hierarchy is not None:
+        base_metric = contraction.customize(hierarchy, base_time)
+        if n:
+            contraction.shortest_path(hierarchy, base_metric, 0, n - 1)
+    return PreparedMap(
+        name_to_idx=name_to_idx,
+        node_positions=node_positions,
+        row_ptr=row_ptr,
+        edge_src=edge_src,
+        col_idx=col_idx,
+        in_row_ptr=in_row_ptr,
+        in_edge_idx=in_edge_idx,
+        edges_entering=[in_edges[in_bounds[i]:in_bounds[i + 1]] for i in range(n)],
+        base_travel_time=base_time,
+        capacity=capacity[order],
+        heuristic_scale=_heuristic_scale(node_positions, edge_src, col_idx, base_time),
+        contraction=hierarchy,
+        base_metric=base_metric,
+    )
+
+def install_map(prepared: PreparedMap):
+    """Makes a prepare_map result the loaded map, with every road empty."""
+    global NAME_TO_IDX, IDX_TO_NAME, NODE_POSITIONS, HEURISTIC_SCALE, ROW_PTR, COL_IDX, EDGE_SRC, IN_ROW_PTR, IN_EDGE_IDX, IN_COL_IDX, EDGE_INDEX, EDGE_ID_STR, EDGE_ROADS
+    global EDGES_ENTERING, ROAD_ID_INDEX
+    global BASE_TRAVEL_TIME, CAPACITY, CURRENT_CONGESTION, CURRENT_VEHICLES, CURRENT_TRAVEL_TIME, WEIGHTS_EPOCH, TRAFFIC_VERSION, ROUTE_EPOCH, _ROUTE_EPOCH_WEIGHTS
+    global INCOMING_COUNT_CHANGED, CONTRACTION, _CONTRACTION_METRIC, _ROUTE_WEIGHTS
+
+    n, m = len(prepared.name_to_idx), len(prepared.col_idx)
+    # Swap everything in under the weights lock, so route_snapshot() never pairs this map's arrays with the last one's
+    with _WEIGHTS_LOCK:
+        NAME_TO_IDX = prepared.name_to_idx
+        IDX_TO_NAME = list(NAME_TO_IDX)
+        NODE_POSITIONS = prepared.node_positions
+        ROW_PTR = prepared.row_ptr
+        EDGE_SRC = prepared.edge_src
+        COL_IDX = prepared.col_idx
+        IN_ROW_PTR = prepared.in_row_ptr
+        IN_EDGE_IDX = prepared.in_edge_idx
+        IN_COL_IDX = EDGE_SRC[IN_EDGE_IDX]
+        EDGE_INDEX = {(IDX_TO_NAME[u], IDX_TO_NAME[v]): e for e, (u, v) in enumerate(zip(EDGE_SRC.tolist(), COL_IDX.tolist()))}
+        EDGE_ID_STR = [f"{u}-{v}" for u, v in EDGE_INDEX]
+        ROAD_ID_INDEX = {road_id: e for e, road_id in enumerate(EDGE_ID_STR)}
+        EDGE_ROADS = list(EDGE_INDEX) # In edge id order
+        EDGES_ENTERING = prepared.edges_entering
 
-def get_graph_copy():
-    return CITY_GRAPH.copy()
+        BASE_TRAVEL_TIME = prepared.base_travel_time
+        CAPACITY = prepared.capacity
+        CURRENT_CONGESTION = np.zeros(m, dtype=np.float64)
+        CURRENT_VEHICLES = np.zeros(m, dtype=np.int64) # Initialize vehicle count
+        INCOMING_COUNT_CHANGED = np.zeros(n, dtype=bool)
+        HEURISTIC_SCALE = prepared.heuristic_scale
+        CURRENT_TRAVEL_TIME = BASE_TRAVEL_TIME.copy() # Initial travel time same as base_travel_time
+        WEIGHTS_EPOCH += 1 # Never reset, so routes cached for a previous map can't be hit again
+        TRAFFIC_VERSION += 1
+        ROUTE_EPOCH += 1
+        _ROUTE_EPOCH_WEIGHTS = BASE_TRAVEL_TIME.copy()
+        CONTRACTION = prepared.contraction
+        _CONTRACTION_METRIC = (ROUTE_EPOCH, prepared.base_metric) # Every road is at its base travel time
+        _ROUTE_WEIGHTS = (ROUTE_EPOCH, current_weights()[0]) # Those base travel times
+    logger.info("Map loaded: %d nodes, %d edges.", n, m)
+    return True
 
-def update_road_vehicle_count(road_segment: Tuple[str, str], delta: int):
+def ch_metric() -> Tuple[Optional[contraction.ContractionHierarchy], Optional[tuple]]:
     """
-    Updates vehicle count on a road segment and recalculates its travel time.
-    delta: +1 if vehicle enters, -1 if vehicle leaves.
+    The hierarchy and its shortcut weights for the current ROUTE_EPOCH, customized from the weights as of
+    the first query in each epoch. Route-cache entries are shared within an epoch anyway, so customizing on
+    every tick's weight change would only cost time. (None, None) when there is no hierarchy.
     """
-    source, target = road_segment
-    road_key = (source, target)
-
-    if road_key not in ROAD_DATA:
-        print(f"Warning: Road data for {source}-{target} not found during vehicle count update.")
-        # If this happens, it's likely an issue with map loading or vehicle pathing
-        # For robustness, we could try to initialize it here, but it's better to ensure it's loaded.
-        if CITY_GRAPH.has_edge(source, target):
-            base_time = CITY_GRAPH.edges[source, target].get('base_travel_time', 10)
-            ROAD_DATA[road_key] = {
-                "base_travel_time": base_time, "capacity": 100,
-                "current_congestion": 0.0, "current_vehicles": 0
-            }
-        else: # Road doesn't exist in graph, severe issue
-            print(f"CRITICAL: Edge {source}-{target} does not exist in graph. Cannot update vehicle count.")
-            return
-
-    ROAD_DATA[road_key]["current_vehicles"] = max(0, ROAD_DATA[road_key]["current_vehicles"] + delta)
-    
+    global _CONTRACTION_METRIC
+    with _WEIGHTS_LOCK:
+        hierarchy, epoch = CONTRACTION, ROUTE_EPOCH
+        if hierarchy is None:
+            return None, None
+        if _CONTRACTION_METRIC[0] == epoch:
+            return hierarchy, _CONTRACTION_METRIC[1]
+        weights = route_weights()
+    # Customizing a big map takes milliseconds: do it outside the weights lock, so traffic updates on the event
+    # loop don't wait for it. The weights snapshot is read-only and the hierarchy is never modified.
+    with _CUSTOMIZE_LOCK:
+        with _WEIGHTS_LOCK:
+            if CONTRACTION is hierarchy and _CONTRACTION_METRIC[0] >= epoch: # Customized while this one waited
+                return hierarchy, _CONTRACTION_METRIC[1]
+        metric = contraction.customize(hierarchy, weights)
+        with _WEIGHTS_LOCK:
+            if CONTRACTION is hierarchy and _CONTRACTION_METRIC[0] < epoch:
+                _CONTRACTION_METRIC = (epoch, metric)
+    return hierarchy, metric
+
+def _heuristic_scale(positions: np.ndarray, edge_src: np.ndarray, col_idx: np.ndarray, base_time: np.ndarray) -> float:
+    """min(base_travel_time / edge length) over all edges, or 0.0 if any node lacks coordinates."""
+    if np.isnan(positions).any():
+        return 0.0
+    lengths = np.hypot(*(positions[col_idx] - positions[edge_src]).T)
+    has_length = lengths > 0
+    if not has_length.any():
+        return 0.0
+    scale = float(np.min(base_time[has_length] / lengths[has_length]))
+    return max(0.0, scale * (1 - 1e-9)) # Margin so float rounding can't make the heuristic inadmissible
+
+def has_node(node_id: str) -> bool:
+    return node_id in NAME_TO_IDX
+
+def node_ids() -> List[str]:
+    return IDX_TO_NAME
+
+def update_edge_vehicle_count(edge_idx: int, delta: int):
+    """Adds delta (+1 as a vehicle enters, -1 as it leaves) to an edge's vehicle count and re-derives its travel time."""
     # Recalculate congestion and travel time based on new vehicle count
-    update_traffic_on_road(
-        f"{source}-{target}", 
-        vehicle_count=ROAD_DATA[road_key]["current_vehicles"]
-    )
+    _update_edge_traffic(edge_idx, vehicle_count=max(0, int(CURRENT_VEHICLES[edge_idx]) + delta))
 
-def update_traffic_on_road(road_id_str: str, congestion_level: Optional[float] = None, vehicle_count: Optional[int] = None):
-    global CITY_GRAPH, ROAD_DATA
-    try:
-        source, target = road_id_str.split('-')
-    except ValueError:
-        print(f"Invalid road_id format: {road_id_str}.")
-        return False
-
-    if not CITY_GRAPH.has_edge(source, target):
-        # print(f"Road {source}-{target} not found in graph for traffic update.") # Can be noisy
-        return False
-
-    road_key = (source, target)
-    if road_key not in ROAD_DATA: # Should be initialized by load_map or update_road_vehicle_count
-         print(f"Warning: Road data for {road_key} not found, initializing with defaults.")
-         base_time = CITY_GRAPH.edges[source,target].get('base_travel_time',10)
-         capacity = 100 # Default capacity
-         ROAD_DATA[road_key] = {
-            "base_travel_time": base_time, "capacity": capacity,
-            "current_congestion": 0.0, "current_vehicles": 0
-        }
+def edge_for_road_id(road_id_str: str) -> Optional[int]:
+    """Edge id of a "source-target" road id, as sent by the HTTP API, or None if there is no such road."""
+    edge_idx = ROAD_ID_INDEX.get(road_id_str)
+    if edge_idx is None:
+        if "-" not in road_id_str:
+            logger.warning("Invalid road_id format: %s.", road_id_str)
+        else:
+            logger.debug("Road %s not found in graph for traffic update.", road_id_str)
+    return edge_idx
+
+def update_traffic_bulk(edge_idx: List[int], congestion_levels: List[Optional[float]], vehicle_counts: List[Optional[int]]):
+    """
+    Applies a batch of updates (parallel lists, one entry per update) in a few vectorized passes, ending in the
+    same state as _update_edge_traffic for each in turn: a vehicle count sets the count and derives congestion
+    from it, otherwise a congestion level is set directly, and a road's last such update decides its congestion.
+    """
+    edges = np.asarray(edge_idx, dtype=np.int64)
+    levels = np.array(congestion_levels, dtype=np.float64) # None -> NaN
+    counts = np.array(vehicle_counts, dtype=np.float64)
+    has_count = ~np.isnan(counts)
+    has_level = ~has_count & ~np.isnan(levels)
 
+    # A repeated road keeps its last count: first occurrences in the reversed updates (fancy assignment
+    # doesn't promise which of several writes to one index wins)
+    count_updates = np.flatnonzero(has_count)[::-1]
+    counted, first = np.unique(edges[count_updates], return_index=True)
+    CURRENT_VEHICLES[counted] = np.maximum(counts[count_updates[first]], 0).astype(np.int64)
+    INCOMING_COUNT_CHANGED[COL_IDX[counted]] = True
+    _derive_congestion(counted)
+    # Position of each road's last count or level update, by taking first occurrences in reverse
+    effective = np.flatnonzero(has_count | has_level)[::-1]
+    _, first = np.unique(edges[effective], return_index=True)
+    last = effective[first]
+    last = last[has_level[last]]
+    CURRENT_CONGESTION[edges[last]] = np.clip(levels[last], 0.0, 1.0)
+    _derive_travel_times(np.unique(edges))
 
+def _update_edge_traffic(edge_idx: int, congestion_level: Optional[float] = None, vehicle_count: Optional[int] = None):
     if vehicle_count is not None:
-        ROAD_DATA[road_key]["current_vehicles"] = max(0, vehicle_count) # Ensure non-negative
-        # Derive congestion from vehicle_count and capacity
-        capacity = ROAD_DATA[road_key]["capacity"]
-        if capacity > 0:
-            # More sensitive congestion: consider capacity fully utilized at capacity, rapidly increases after
-            # Example: if vehicle_count = capacity, congestion = 0.5. If vehicle_count = 1.5*capacity, congestion = 1.0
-            # This needs tuning. Original: min(1.0, vehicle_count / (capacity * 1.5))
-            # Let's try:
-            if vehicle_count <= capacity:
-                derived_congestion = (vehicle_count / capacity) * 0.6 # Max 0.6 congestion up to capacity
-            else:
-                # Faster increase beyond capacity
-                over_capacity_ratio = (vehicle_count - capacity) / (capacity * 0.5) # 0.5 means jam at 1.5x capacity
-                derived_congestion = 0.6 + (0.4 * min(1.0, over_capacity_ratio))
-            
-            ROAD_DATA[road_key]["current_congestion"] = min(1.0, max(0.0, derived_congestion))
-
-        else: # Zero capacity road (should not happen for drivable roads)
-            ROAD_DATA[road_key]["current_congestion"] = 1.0 if ROAD_DATA[road_key]["current_vehicles"] > 0 else 0.0
+        CURRENT_VEHICLES[edge_idx] = max(0, vehicle_count) # Ensure non-negative
+        INCOMING_COUNT_CHANGED[COL_IDX[edge_idx]] = True
+        _derive_congestion(edge_idx)
     elif congestion_level is not None:
-        ROAD_DATA[road_key]["current_congestion"] = max(0.0, min(1.0, congestion_level))
+        CURRENT_CONGESTION[edge_idx] = max(0.0, min(1.0, congestion_level))
         # Note: If only congestion_level is given, current_vehicles might become out of sync.
         # Prefer updating via vehicle_count for the simulation.
+    _derive_travel_times(edge_idx)
 
-    base_time = ROAD_DATA[road_key]["base_travel_time"]
-    congestion = ROAD_DATA[road_key]["current_congestion"]
-    
-    # Cost function: base_time * (1 + k * congestion^alpha)
-    # Simple linear: penalty_factor = 1 + (4 * congestion) 
-    # More aggressive (exponential-like effect):
-    if congestion < 0.99: # Avoid division by zero
-        penalty_factor = 1 / (1 - congestion * 0.9) # e.g. congestion 0.5 -> 1.8x, cong 0.8 -> 3.5x, cong 0.9 -> 5.2x
-    else:
-        penalty_factor = 20 # Max penalty for fully congested
-
-    current_travel_time = base_time * penalty_factor
-    CITY_GRAPH.edges[source, target]['current_travel_time'] = current_travel_time
-    
-    # This print can be very noisy during simulation
-    # print(f"Road {source}-{target} updated: Vehicles {ROAD_DATA[road_key]['current_vehicles']}, Congestion {congestion:.2f}, New Travel Time {current_travel_time:.2f}")
-    return True
+    if logger.isEnabledFor(logging.DEBUG): # Very noisy during simulation; skip the array reads unless enabled
+        logger.debug(
+            "Road %s updated: Vehicles %d, Congestion %.2f, New Travel Time %.2f", EDGE_ID_STR[edge_idx],
+            CURRENT_VEHICLES[edge_idx], CURRENT_CONGESTION[edge_idx], CURRENT_TRAVEL_TIME[edge_idx]
+        )
+
+def recompute_travel_times(changed_mask: Optional[np.ndarray] = None):
+    """
+    Re-derives congestion and current travel time from vehicle counts for every edge, or only for the
+    edges nonzero in changed_mask (a boolean mask, or per-edge count deltas), in one vectorized pass.
+    """
+    edges = slice(None) if changed_mask is None else np.flatnonzero(changed_mask)
+    INCOMING_COUNT_CHANGED[COL_IDX[edges]] = True
+    _derive_congestion(edges)
+    _derive_travel_times(edges)
+
+# The traffic model below is the single definition used by both single-road updates and the
+# per-tick bulk recompute; `edges` is anything that indexes the edge arrays (an id, a slice, an id array).
+def _derive_congestion(edges):
+    """Congestion from vehicle count and capacity."""
+    vehicles = CURRENT_VEHICLES[edges].astype(np.float64)
+    capacity = CAPACITY[edges]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = vehicles / capacity
+        # Consider capacity fully utilized at capacity (0.6), then rise faster: 0.5 means jam (1.0) at 1.5x capacity
+        congestion = np.where(ratio <= 1.0, ratio * 0.6, 0.6 + 0.4 * np.minimum(1.0, (ratio - 1.0) / 0.5))
+    # Zero capacity road (should not happen for drivable roads) is jammed as soon as anything is on it
+    CURRENT_CONGESTION[edges] = np.where(capacity > 0, np.clip(congestion, 0.0, 1.0), (vehicles > 0).astype(np.float64))
+
+def _derive_travel_times(edges):
+    """Current travel time from congestion; bumps WEIGHTS_EPOCH if any weight changed."""
+    global WEIGHTS_EPOCH, TRAFFIC_VERSION
+    TRAFFIC_VERSION += 1 # Every traffic write ends here, so counts or congestion may have changed too
+    congestion = CURRENT_CONGESTION[edges]
+    # Cost function: base_time * penalty, with an exponential-like effect:
+    # e.g. congestion 0.5 -> 1.8x, cong 0.8 -> 3.5x, cong 0.9 -> 5.2x, and a max penalty of 20 for fully congested
+    penalty = np.where(congestion < 0.99, 1.0 / (1.0 - np.minimum(congestion, 0.99) * 0.9), 20.0)
+    travel_time = BASE_TRAVEL_TIME[edges] * penalty
+    if not np.array_equal(travel_time, CURRENT_TRAVEL_TIME[edges]):
+        with _WEIGHTS_LOCK:
+            CURRENT_TRAVEL_TIME[edges] = travel_time
+            WEIGHTS_EPOCH += 1
+            baseline = _ROUTE_EPOCH_WEIGHTS[edges]
+            if np.any(np.abs(travel_time - baseline) > ROUTE_EPOCH_TOLERANCE * baseline):
+                bump_route_epoch()
+
+def bump_route_epoch():
+    """Starts a new route-cache epoch, e.g. after a manual traffic update that must be seen immediately."""
+    global ROUTE_EPOCH, _ROUTE_EPOCH_WEIGHTS
+    with _WEIGHTS_LOCK:
+        ROUTE_EPOCH += 1
+        _ROUTE_EPOCH_WEIGHTS = CURRENT_TRAVEL_TIME.copy()
+
+def current_weights() -> Tuple[np.ndarray, int]:
+    """
+    Read-only snapshot of the edge weights and the epoch they belong to. Safe to hold across a search
+    running in another thread: later traffic updates write to the staging buffer, never to a snapshot.
+    """
+    global _PUBLISHED_WEIGHTS
+    snapshot = _PUBLISHED_WEIGHTS
+    if snapshot[1] == WEIGHTS_EPOCH:
+        return snapshot
+    with _WEIGHTS_LOCK:
+        if _PUBLISHED_WEIGHTS[1] != WEIGHTS_EPOCH:
+            weights = CURRENT_TRAVEL_TIME.copy()
+            weights.flags.writeable = False
+            _PUBLISHED_WEIGHTS = (weights, WEIGHTS_EPOCH)
+        return _PUBLISHED_WEIGHTS
+
+@dataclass
+class RouteSnapshot:
+    """The loaded map as a search sees it, see route_snapshot."""
+    name_to_idx: Dict[str, int]
+    idx_to_name: List[str]
+    row_ptr: np.ndarray
+    col_idx: np.ndarray
+    weights: np.ndarray
+    node_positions: np.ndarray
+    heuristic_scale: float
+    contraction: Optional[contraction.ContractionHierarchy]
+    metric: Optional[tuple] # The hierarchy's latest customization (call ch_metric first for the current epoch's)
+
+def route_weights() -> np.ndarray:
+    """
+    Read-only edge weights for route searches in the current ROUTE_EPOCH: current_weights() as of the first
+    search in the epoch. The hierarchy is customized from these and full searches run on them, so a vehicle
+    gets the same route whichever way its batch was searched.
+    """
+    global _ROUTE_WEIGHTS
+    with _WEIGHTS_LOCK:
+        if _ROUTE_WEIGHTS[0] != ROUTE_EPOCH:
+            _ROUTE_WEIGHTS = (ROUTE_EPOCH, current_weights()[0])
+        return _ROUTE_WEIGHTS[1]
+
+def route_snapshot() -> RouteSnapshot:
+    """
+    Node tables, CSR arrays, weights and hierarchy taken together, so a search in a worker thread can't pair
+    one map's node indices with another's arrays while install_map swaps them (the kernels don't bounds-check).
+    """
+    with _WEIGHTS_LOCK:
+        # install_map swaps a hierarchy in with its base customization, and ch_metric only keeps a metric for the
+        # hierarchy it was customized from, so CONTRACTION and the stored metric always belong together
+        return RouteSnapshot(
+            name_to_idx=NAME_TO_IDX, idx_to_name=IDX_TO_NAME, row_ptr=ROW_PTR, col_idx=COL_IDX,
+            weights=route_weights(), node_positions=NODE_POSITIONS, heuristic_scale=HEURISTIC_SCALE,
+            contraction=CONTRACTION, metric=_CONTRACTION_METRIC[1]
+        )
 
 
 def get_current_road_conditions() -> Dict[str, Dict]:
-    conditions = {}
-    for (u,v), data in ROAD_DATA.items():
-        road_id = f"{u}-{v}"
-        if CITY_GRAPH.has_edge(u,v): # Ensure edge exists
-            conditions[road_id] = {
-                "base_travel_time": data["base_travel_time"],
-                "current_congestion": data["current_congestion"],
-                "current_vehicles": data["current_vehicles"],
-                "current_travel_time": CITY_GRAPH.edges[u,v]['current_travel_time']
-            }
-        else: # Should not happen if map is loaded correctly
-            conditions[road_id] = {
-                "base_travel_time": data.get("base_travel_time",0),
-                "current_congestion": data.get("current_congestion",1.0),
-                "current_vehicles": data.get("current_vehicles",0),
-                "current_travel_time": data.get("base_travel_time", float('inf')) # Indicate issue
-            }
-    return conditions
-
-def get_roads_entering_intersection(intersection_id: str) -> List[Tuple[str, str]]:
-    if not CITY_GRAPH.has_node(intersection_id):
-        return []
-    return [(u, v) for u, v in CITY_GRAPH.in_edges(intersection_id)]
-
-def get_roads_leaving_intersection(intersection_id: str) -> List[Tuple[str, str]]:
-     if not CITY_GRAPH.has_node(intersection_id):
-        return []
-     return [(u, v) for u, v in CITY_GRAPH.out_edges(intersection_id)]
\ No newline at end of file
+    # One bulk .tolist() per array instead of indexing (and boxing) every field of every edge
+    columns = zip(
+        EDGE_ID_STR, BASE_TRAVEL_TIME.tolist(), CURRENT_CONGESTION.tolist(),
+        CURRENT_VEHICLES.tolist(), CURRENT_TRAVEL_TIME.tolist()
+    )
+    return {
+        road_id: {
+            "base_travel_time": base_time,
+            "current_congestion": congestion,
+            "current_vehicles": vehicles,
+            "current_travel_time": travel_time
+        }
+        for road_id, base_time, congestion, vehicles, travel_time in columns
+    }
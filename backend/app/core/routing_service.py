@@ -1,27 +1,136 @@
-import networkx as nx
+import asyncio
+import logging
+import os
+import numpy as np
+from collections import Counter, defaultdict
+from functools import lru_cache, partial
 from typing import List, Optional, Tuple, Dict # Added Dict
-from app.core import graph_manager # Import module itself
-from app.models import SuggestedRoute, Vehicle, VehicleStateEnum # Added Vehicle, VehicleStateEnum
+from app.core import contraction, graph_manager # Import module itself
+from app.core.dijkstra_nb import dijkstra_csr, sssp_csr
+from app.internal_models import Vehicle
+from app.models import VehicleStateEnum
+
+logger = logging.getLogger(__name__)
+
+ROUTING_THREADS = os.cpu_count() or 1 # Searches batch_assign_routes_concurrently runs at once
+_ROUTING_SLOTS = asyncio.Semaphore(ROUTING_THREADS)
+# A full search costs about eight hierarchy queries (100x100 grid; about four at 30x30), so batched vehicles
+# leaving the same node, or heading to the same one, share one once there are this many of them
+SHARED_SEARCH_VEHICLES = 8
 
 # This will store active vehicles. In a real system, this would be a database.
 # ACTIVE_VEHICLES_DB: Dict[str, Vehicle] = {} # Moved to main.py or a dedicated simulation manager
 
 def find_fastest_path(start_node_id: str, end_node_id: str) -> Optional[Tuple[List[str], float]]:
-    graph = graph_manager.get_graph_copy()
-    if not graph.has_node(start_node_id) or not graph.has_node(end_node_id):
-        print(f"Error: Start or end node not in graph. Start: {start_node_id}, End: {end_node_id}")
+    if not graph_manager.has_node(start_node_id) or not graph_manager.has_node(end_node_id):
+        logger.warning("Start or end node not in graph. Start: %s, End: %s", start_node_id, end_node_id)
+        return None
+
+    _drop_stale_routes()
+    path_info = _cached_fastest_path(start_node_id, end_node_id, graph_manager.ROUTE_EPOCH)
+    if path_info is None:
+        return None
+    path, cost = path_info
+    return list(path), cost
+
+
+@lru_cache(maxsize=4096)
+def _cached_fastest_path(start_node_id: str, end_node_id: str, route_epoch: int) -> Optional[Tuple[Tuple[str, ...], float]]:
+    """
+    Shortest path between two nodes. route_epoch only keys the cache: it changes whenever some edge
+    weight has moved materially (see graph_manager.ROUTE_EPOCH), so every vehicle asking for the same pair
+    in between shares one search. Paths are returned as tuples so a cached result can't be mutated by a caller.
+    """
+    # May run in a worker thread while a new map is installed: node indices, arrays and names all come from
+    # one snapshot, and a node the caller saw may be gone from it.
+    graph_manager.ch_metric() # Customizes the hierarchy for this epoch if no search has yet
+    snapshot = graph_manager.route_snapshot()
+    src = snapshot.name_to_idx.get(start_node_id)
+    dst = snapshot.name_to_idx.get(end_node_id)
+    if src is None or dst is None:
+        return None
+
+    # Query the contraction hierarchy: two short climbs up precomputed shortcuts instead of a search across
+    # the map. Its weights are a per-epoch customization of a read-only snapshot, so nothing here races
+    # a traffic update. Without a hierarchy (no numba, or a map above its size caps), A* over the snapshot
+    # guided by straight-line distance when every node has coordinates, plain Dijkstra otherwise.
+    if snapshot.contraction is not None:
+        path, cost = contraction.shortest_path(snapshot.contraction, snapshot.metric, src, dst)
+    else:
+        path, cost = dijkstra_csr(
+            snapshot.row_ptr, snapshot.col_idx, snapshot.weights, src, dst,
+            snapshot.node_positions, snapshot.heuristic_scale
+        )
+    if len(path) == 0:
+        logger.debug("No path found from %s to %s", start_node_id, end_node_id)
+        return None
+    names = snapshot.idx_to_name
+    return tuple(names[i] for i in path.tolist()), float(cost)
+
+
+def find_fastest_path_from(start_node_id: str, end_node_id: str) -> Optional[Tuple[List[str], float]]:
+    """
+    Same result as find_fastest_path, but read off a cached full shortest-path tree from the start node, so
+    further requests from that node (to any destination) in the same route epoch are just a walk back
+    along the tree. Suits callers that reroute repeatedly from the same place, like /vehicles/{id}/reroute.
+    """
+    if not graph_manager.has_node(start_node_id) or not graph_manager.has_node(end_node_id):
+        logger.warning("Start or end node not in graph. Start: %s, End: %s", start_node_id, end_node_id)
         return None
-    try:
-        # Use 'current_travel_time' which is updated by traffic conditions
-        path = nx.dijkstra_path(graph, source=start_node_id, target=end_node_id, weight='current_travel_time')
-        cost = nx.dijkstra_path_length(graph, source=start_node_id, target=end_node_id, weight='current_travel_time')
-        return path, cost
-    except nx.NetworkXNoPath:
-        print(f"No path found from {start_node_id} to {end_node_id}")
+
+    _drop_stale_routes()
+    tree = _shortest_path_tree(start_node_id, graph_manager.ROUTE_EPOCH)
+    if tree is None: # A new map without the start node was loaded meanwhile
         return None
-    except nx.NodeNotFound: # Should be caught by initial check, but good practice
-        print(f"Node not found during pathfinding (should not happen). Start: {start_node_id}, End: {end_node_id}")
+    dist, prev, snapshot = tree
+    dst = snapshot.name_to_idx.get(end_node_id)
+    if dst is None or dist[dst] == np.inf: # dst is None only if a new map was loaded meanwhile
+        logger.debug("No path found from %s to %s", start_node_id, end_node_id)
         return None
+    src = snapshot.name_to_idx[start_node_id]
+    path = [dst]
+    while path[-1] != src:
+        path.append(int(prev[path[-1]]))
+    return [snapshot.idx_to_name[i] for i in reversed(path)], float(dist[dst])
+
+
+@lru_cache(maxsize=256) # Each entry holds two node-sized arrays
+def _shortest_path_tree(start_node_id: str, route_epoch: int) -> Optional[Tuple[np.ndarray, np.ndarray, graph_manager.RouteSnapshot]]:
+    """
+    Full Dijkstra (dist, prev) from a node over a graph snapshot, with the snapshot that gives the indices
+    their names, or None if the node isn't on the map anymore. route_epoch only keys the cache.
+    """
+    snapshot = graph_manager.route_snapshot() # May run in a worker thread
+    src = snapshot.name_to_idx.get(start_node_id)
+    if src is None: # A new map was loaded since the caller checked
+        return None
+    dist, prev = sssp_csr(snapshot.row_ptr, snapshot.col_idx, snapshot.weights, src)
+    return dist, prev, snapshot
+
+
+_CACHED_ROUTE_EPOCH = -1 # ROUTE_EPOCH the route caches were filled under
+
+def _drop_stale_routes():
+    """
+    Empties the route caches once ROUTE_EPOCH has moved on. Entries keyed by an older epoch can never be
+    hit again, and the LRU alone would only push them out as new ones come in (the trees are node-sized).
+    """
+    global _CACHED_ROUTE_EPOCH
+    if _CACHED_ROUTE_EPOCH == graph_manager.ROUTE_EPOCH:
+        return
+    if logger.isEnabledFor(logging.DEBUG):
+        paths, trees = _cached_fastest_path.cache_info(), _shortest_path_tree.cache_info()
+        logger.debug(
+            "Route epoch %d done. Path cache: %d hits, %d misses. Tree cache: %d hits, %d misses.",
+            _CACHED_ROUTE_EPOCH, paths.hits, paths.misses, trees.hits, trees.misses
+        )
+    clear_route_cache()
+    _CACHED_ROUTE_EPOCH = graph_manager.ROUTE_EPOCH
+
+def clear_route_cache():
+    """Drops every cached route, e.g. when a new map makes them all unreachable anyway."""
+    _cached_fastest_path.cache_clear()
+    _shortest_path_tree.cache_clear()
 
 
 def assign_route_to_vehicle(vehicle: Vehicle, vehicles_db: Dict[str, Vehicle]) -> bool:
@@ -31,10 +140,15 @@ def assign_route_to_vehicle(vehicle: Vehicle, vehicles_db: Dict[str, Vehicle]) -
     Returns True if successful, False otherwise.
     """
     if not vehicle.current_node_id or not vehicle.destination_node_id:
-        print(f"Vehicle {vehicle.id} missing current or destination node for routing.")
+        logger.warning("Vehicle %s missing current or destination node for routing.", vehicle.id)
         return False
 
     path_info = find_fastest_path(vehicle.current_node_id, vehicle.destination_node_id)
+    return apply_path(vehicle, path_info, vehicles_db)
+
+
+def apply_path(vehicle: Vehicle, path_info: Optional[Tuple[List[str], float]], vehicles_db: Dict[str, Vehicle]) -> bool:
+    """Stores a routing result (or the lack of one) on the vehicle. Returns True if it got a path."""
     if path_info:
         path, cost = path_info
         vehicle.current_path = path
@@ -47,17 +161,112 @@ def assign_route_to_vehicle(vehicle: Vehicle, vehicles_db: Dict[str, Vehicle]) -
         # Add to new road (handled by simulation step now)
         
         vehicles_db[vehicle.id] = vehicle # Ensure the DB is updated with the new path
-        print(f"Route assigned to vehicle {vehicle.id}: {path} with cost {cost:.2f}")
+        logger.debug("Route assigned to vehicle %s: %s with cost %.2f", vehicle.id, path, cost)
         return True
     else:
-        print(f"Could not find path for vehicle {vehicle.id} from {vehicle.current_node_id} to {vehicle.destination_node_id}")
+        logger.debug("Could not find path for vehicle %s from %s to %s", vehicle.id, vehicle.current_node_id, vehicle.destination_node_id)
         vehicle.current_path = None
         vehicle.path_cost = None
         vehicle.state = VehicleStateEnum.IDLE # Or some error state
         vehicles_db[vehicle.id] = vehicle
         return False
 
+
+async def batch_assign_routes_concurrently(vehicles: List[Vehicle], vehicles_db: Dict[str, Vehicle]) -> int:
+    """
+    Routes several vehicles at once. Vehicles are bucketed by destination, and a bucket of at least
+    SHARED_SEARCH_VEHICLES shares one full Dijkstra from its destination over the reversed graph, which
+    gives the shortest path from every node to that destination. The searches run in worker threads, at most ROUTING_THREADS at a time: the
+    compiled kernels release the GIL, so buckets are searched in parallel while the event loop stays free.
+    Paths are applied back on the event loop, skipping vehicles that were moved or removed meanwhile.
+    Returns the number of vehicles that got a route.
+    """
+    groups, jobs = _batch_routing_jobs(vehicles)
+
+    async def run(job):
+        async with _ROUTING_SLOTS:
+            return await asyncio.to_thread(job)
+
+    return _apply_batch(groups, await asyncio.gather(*(run(job) for job in jobs)), vehicles_db)
+
+
+def _batch_routing_jobs(vehicles: List[Vehicle]):
+    """
+    Splits a batch into independent routing jobs: one per destination bucket, plus the vehicles best routed
+    one by one in up to ROUTING_THREADS chunks. Returns (groups, jobs); jobs[i]() gives one path_info per
+    (vehicle, start node) in groups[i] and reads nothing that a traffic update or new map could change.
+    """
+    by_destination: Dict[int, List[Vehicle]] = defaultdict(list)
+    singles = []
+    for vehicle in vehicles:
+        dst = graph_manager.NAME_TO_IDX.get(vehicle.destination_node_id)
+        if dst is None or vehicle.current_node_id not in graph_manager.NAME_TO_IDX:
+            singles.append(vehicle) # find_fastest_path reports the missing node as usual
+            continue
+        by_destination[dst].append(vehicle)
+
+    groups, jobs = [], []
+    reverse_weights = None
+    for dst, bucket in by_destination.items():
+        if len(bucket) < SHARED_SEARCH_VEHICLES: # Single-pair searches (maybe cached) are cheaper in total
+            singles.extend(bucket)
+            continue
+        if reverse_weights is None: # The weights single-pair searches use too, so both give the same routes
+            reverse_weights = graph_manager.route_weights()[graph_manager.IN_EDGE_IDX]
+        sources = [graph_manager.NAME_TO_IDX[vehicle.current_node_id] for vehicle in bucket]
+        groups.append([(vehicle, vehicle.current_node_id) for vehicle in bucket])
+        jobs.append(partial(
+            _paths_to, graph_manager.IN_ROW_PTR, graph_manager.IN_COL_IDX, reverse_weights,
+            graph_manager.IDX_TO_NAME, dst, sources
+        ))
+
+    # Single-pair searches are short, so they go in chunks rather than a thread hop each. Vehicles leaving
+    # from the same node in numbers share that node's cached shortest-path tree instead (see find_fastest_path_from).
+    starts = Counter(vehicle.current_node_id for vehicle in singles)
+    for chunk in np.array_split(np.arange(len(singles)), min(len(singles), ROUTING_THREADS)) if singles else []:
+        pairs = [
+            (singles[i].current_node_id, singles[i].destination_node_id, starts[singles[i].current_node_id] >= SHARED_SEARCH_VEHICLES)
+            for i in chunk.tolist()
+        ]
+        groups.append([(singles[i], singles[i].current_node_id) for i in chunk.tolist()])
+        jobs.append(partial(_paths_between, pairs))
+    return groups, jobs
+
+
+def _paths_to(in_row_ptr, in_col_idx, reverse_weights, names, dst: int, sources: List[int]):
+    """Paths from each source to dst, read off one full Dijkstra from dst over the reversed graph."""
+    dist, next_hop = sssp_csr(in_row_ptr, in_col_idx, reverse_weights, dst)
+    path_infos = []
+    for node in sources:
+        path_info = None
+        if dist[node] != np.inf:
+            path = [node]
+            while node != dst:
+                node = int(next_hop[node])
+                path.append(node)
+            path_info = [names[i] for i in path], float(dist[path[0]])
+        path_infos.append(path_info)
+    return path_infos
+
+
+def _paths_between(pairs: List[Tuple[str, str, bool]]):
+    """Path for each (start, end, start_is_shared); shared starts are read off the start's shortest-path tree."""
+    return [(find_fastest_path_from if shared else find_fastest_path)(start, end) for start, end, shared in pairs]
+
+
+def _apply_batch(groups, results, vehicles_db: Dict[str, Vehicle]) -> int:
+    """
+    Applies the paths of _batch_routing_jobs to their vehicles. Vehicles that have since left vehicles_db or
+    their start node (e.g. rerouted elsewhere) are left alone. Returns the number that got a route.
+    """
+    assigned = 0
+    for group, path_infos in zip(groups, results):
+        for (vehicle, start), path_info in zip(group, path_infos):
+            if vehicles_db.get(vehicle.id) is vehicle and vehicle.current_node_id == start:
+                assigned += apply_path(vehicle, path_info, vehicles_db)
+    return assigned
+
 # Rerouting logic will now be:
 # 1. Vehicle becomes IDLE (e.g., due to massive unexpected delay or manual trigger).
-# 2. Simulation or an API call triggers assign_route_to_vehicle for it.
+# 2. Simulation (batch_assign_routes_concurrently, once per tick) or an API call (assign_route_to_vehicle) routes it.
 # The find_fastest_path always uses current graph state.
\ No newline at end of file
@@ -1,9 +1,16 @@
 # backend/app/core/simulation_manager.py
 import asyncio
+import logging
 import time
-from typing import Dict
-from app.models import Vehicle, VehicleStateEnum
+import numpy as np
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set
+from app.internal_models import Vehicle
+from app.models import VehicleStateEnum
 from app.core import graph_manager, routing_service # graph_manager for road data, routing_service for pathfinding
+from app.core.dijkstra_nb import HAVE_NUMBA, njit
+
+logger = logging.getLogger(__name__)
 
 SIMULATION_STEP_INTERVAL_SECONDS = 1  # How often the simulation advances (e.g., 1 real second = X sim seconds)
 SIMULATION_TIME_MULTIPLIER = 5 # How many simulated seconds pass for each SIMULATION_STEP_INTERVAL_SECONDS
@@ -15,17 +22,229 @@ SIMULATION_TIME: float = 0.0 # Total simulated seconds passed
 simulation_task = None
 _stop_simulation = False
 
+# Vehicle states as small ints for the per-vehicle arrays
+STATE_IDLE, STATE_ON_ROUTE, STATE_ARRIVED = 0, 1, 2
+STATE_CODES = {VehicleStateEnum.IDLE: STATE_IDLE, VehicleStateEnum.ON_ROUTE: STATE_ON_ROUTE, VehicleStateEnum.ARRIVED: STATE_ARRIVED}
+STATE_NAMES = (VehicleStateEnum.IDLE, VehicleStateEnum.ON_ROUTE, VehicleStateEnum.ARRIVED)
+
+
+@dataclass
+class VehicleArrays:
+    """
+    Per-vehicle simulation state as parallel arrays (row r belongs to vehicle ids[r]), so a tick advances
+    every vehicle with a handful of vectorized operations. The Vehicle objects in VEHICLES_DB keep the
+    identity and route; their dynamic fields are only refreshed from here on demand (materialize_vehicles).
+    Routes are stored as edge ids back to back in path_edges, row r's starting at path_start[r].
+    """
+    time_on_segment: np.ndarray
+    path_index: np.ndarray # Index of the route edge the vehicle is on / will enter next
+    state: np.ndarray
+    segment: np.ndarray # Edge id of the road the vehicle is on, -1 while at an intersection
+    node: np.ndarray # Current node index
+    destination: np.ndarray
+    path_start: np.ndarray
+    path_len: np.ndarray # Number of edges in the route
+    path_edges: np.ndarray
+    path_used: int = 0
+    size: int = 0
+    ids: List[str] = field(default_factory=list)
+    rows: Dict[str, int] = field(default_factory=dict)
+
+    ROW_FIELDS = ("time_on_segment", "path_index", "state", "segment", "node", "destination", "path_start", "path_len")
+
+    @classmethod
+    def with_capacity(cls, capacity: int = 64) -> "VehicleArrays":
+        int_row = lambda: np.zeros(capacity, dtype=np.int64)
+        return cls(
+            time_on_segment=np.zeros(capacity, dtype=np.float64), path_index=int_row(),
+            state=np.zeros(capacity, dtype=np.int8), segment=np.full(capacity, -1, dtype=np.int64),
+            node=int_row(), destination=int_row(), path_start=int_row(), path_len=int_row(),
+            path_edges=np.zeros(capacity * 8, dtype=np.int64),
+        )
+
+    def row_for(self, vehicle_id: str) -> int:
+        """Row of the vehicle, adding one (doubling the arrays when full) for a new id."""
+        row = self.rows.get(vehicle_id)
+        if row is not None:
+            return row
+        if self.size == len(self.state):
+            for name in self.ROW_FIELDS:
+                old = getattr(self, name)
+                grown = np.zeros(2 * len(old), dtype=old.dtype)
+                grown[:self.size] = old[:self.size]
+                setattr(self, name, grown)
+        row = self.size
+        self.size += 1
+        self.ids.append(vehicle_id)
+        self.rows[vehicle_id] = row
+        self.segment[row] = -1
+        self.path_len[row] = 0
+        return row
+
+    def set_route(self, row: int, edges: List[int]):
+        self.path_len[row] = 0 # Its old route is garbage from here on
+        if self.path_used + len(edges) > len(self.path_edges):
+            self._compact_routes(len(edges))
+        self.path_start[row] = self.path_used
+        self.path_len[row] = len(edges)
+        self.path_edges[self.path_used:self.path_used + len(edges)] = edges
+        self.path_used += len(edges)
+
+    def _compact_routes(self, extra: int):
+        """Drops replaced routes from path_edges, growing it if the live ones still don't leave room for `extra`."""
+        starts, lengths = self.path_start[:self.size], self.path_len[:self.size]
+        needed = int(lengths.sum()) + extra
+        compacted = np.zeros(max(len(self.path_edges), 2 * needed), dtype=np.int64)
+        used = 0
+        for row in np.flatnonzero(lengths).tolist():
+            start, length = int(starts[row]), int(lengths[row])
+            compacted[used:used + length] = self.path_edges[start:start + length]
+            starts[row] = used
+            used += length
+        self.path_edges = compacted
+        self.path_used = used
+
+
+VEHICLE_ARRAYS = VehicleArrays.with_capacity()
+# Rows currently IDLE, so the loop finds vehicles to reroute without scanning the fleet. The step itself only
+# ever moves ON_ROUTE rows to ARRIVED, so every change in or out of IDLE goes through _set_state.
+IDLE_VEHICLE_ROWS: Set[int] = set()
+_vehicle_objects_stale = False # Set by each tick; cleared once every Vehicle object has been refreshed
+
 def initialize_simulation(vehicles_db_ref: Dict[str, Vehicle]):
     global VEHICLES_DB, SIMULATION_TIME, _stop_simulation
     VEHICLES_DB = vehicles_db_ref
     SIMULATION_TIME = 0.0
     _stop_simulation = False
-    print("Simulation Manager Initialized.")
+    clear_vehicles()
+    logger.info("Simulation Manager Initialized.")
+
+def clear_vehicles():
+    """Forgets every tracked vehicle. Road counts are left alone: this is used when a new map replaces them."""
+    global VEHICLE_ARRAYS, _vehicle_objects_stale
+    VEHICLE_ARRAYS = VehicleArrays.with_capacity()
+    IDLE_VEHICLE_ROWS.clear()
+    _vehicle_objects_stale = False
+
+def _set_state(row: int, state: int):
+    VEHICLE_ARRAYS.state[row] = state
+    if state == STATE_IDLE:
+        IDLE_VEHICLE_ROWS.add(row)
+    else:
+        IDLE_VEHICLE_ROWS.discard(row)
+
+def track_vehicle(vehicle: Vehicle):
+    """
+    Copies a Vehicle object's state and route into its array row. Call after anything outside the
+    simulation step changes a vehicle (creation, routing, rerouting).
+    """
+    va = VEHICLE_ARRAYS
+    row = va.row_for(vehicle.id)
+    route = vehicle.current_path or []
+    edges = [graph_manager.EDGE_INDEX.get(road) for road in zip(route, route[1:])]
+    if None in edges: # Should not happen if pathing is correct; leave it IDLE so it gets rerouted
+        logger.error("Route of vehicle %s uses a road not in the map. Path: %s", vehicle.id, vehicle.current_path)
+        vehicle.current_path = None
+        vehicle.state = VehicleStateEnum.IDLE
+        edges = []
+    va.set_route(row, edges)
+    va.time_on_segment[row] = vehicle.time_on_current_segment
+    va.path_index[row] = vehicle.current_path_index
+    _set_state(row, STATE_CODES[vehicle.state])
+    va.segment[row] = graph_manager.EDGE_INDEX.get(vehicle.current_road_segment, -1) if vehicle.current_road_segment else -1
+    va.node[row] = graph_manager.NAME_TO_IDX[vehicle.current_node_id]
+    va.destination[row] = graph_manager.NAME_TO_IDX[vehicle.destination_node_id]
+
+def remove_from_road(vehicle: Vehicle):
+    """Takes the vehicle off the road it is on, if any, by the edge id kept in its row."""
+    va = VEHICLE_ARRAYS
+    row = va.rows.get(vehicle.id)
+    if row is not None and va.segment[row] >= 0:
+        graph_manager.update_edge_vehicle_count(int(va.segment[row]), -1)
+        va.segment[row] = -1
+    vehicle.current_road_segment = None
+
+def materialize_vehicles(rows: Optional[np.ndarray] = None):
+    """
+    Writes the array state back into the Vehicle objects of the given rows, or of every vehicle if
+    any tick ran since the last full refresh. Called by readers of VEHICLES_DB before they look.
+    """
+    global _vehicle_objects_stale
+    va = VEHICLE_ARRAYS
+    if rows is None:
+        if not _vehicle_objects_stale:
+            return
+        rows = np.arange(va.size)
+        _vehicle_objects_stale = False
+    names, roads, ids, vehicles_db = graph_manager.IDX_TO_NAME, graph_manager.EDGE_ROADS, va.ids, VEHICLES_DB
+    columns = zip(
+        rows.tolist(), va.time_on_segment[rows].tolist(), va.path_index[rows].tolist(),
+        va.state[rows].tolist(), va.segment[rows].tolist(), va.node[rows].tolist()
+    )
+    for row, time_on_segment, path_index, state, segment, node in columns:
+        vehicle = vehicles_db[ids[row]]
+        vehicle.time_on_current_segment = time_on_segment
+        vehicle.current_path_index = path_index
+        vehicle.state = STATE_NAMES[state]
+        vehicle.current_road_segment = roads[segment] if segment >= 0 else None
+        vehicle.current_node_id = names[node]
+
+def materialize_vehicle(vehicle_id: str):
+    """materialize_vehicles for one vehicle's row, for readers of a single Vehicle object."""
+    row = VEHICLE_ARRAYS.rows.get(vehicle_id)
+    if row is not None:
+        materialize_vehicles(np.array([row]))
+
+def vehicle_dicts(start: int = 0, stop: Optional[int] = None) -> List[Dict]:
+    """
+    Vehicles in rows start:stop (default all) as plain dicts in the Vehicle schema, read straight from the
+    arrays rather than through materialize_vehicles and the response model, for endpoints that serialize the fleet.
+    """
+    va = VEHICLE_ARRAYS
+    rows = slice(start, va.size if stop is None else min(stop, va.size))
+    names, roads = graph_manager.IDX_TO_NAME, graph_manager.EDGE_ROADS
+    columns = zip(
+        va.ids[rows], va.time_on_segment[rows].tolist(), va.path_index[rows].tolist(),
+        va.state[rows].tolist(), va.segment[rows].tolist(), va.node[rows].tolist()
+    )
+    records = []
+    append, vehicles_db = records.append, VEHICLES_DB
+    for vehicle_id, time_on_segment, path_index, state, segment, node in columns:
+        vehicle = vehicles_db[vehicle_id] # For the fields the simulation never changes
+        append({
+            "id": vehicle_id,
+            "start_node_id": vehicle.start_node_id,
+            "destination_node_id": vehicle.destination_node_id,
+            "current_node_id": names[node],
+            "current_road_segment": roads[segment] if segment >= 0 else None,
+            "time_on_current_segment": time_on_segment,
+            "current_path_index": path_index,
+            "state": STATE_NAMES[state],
+            "current_path": vehicle.current_path,
+            "path_cost": vehicle.path_cost,
+        })
+    return records
+
+def route_dicts(start: int = 0, stop: Optional[int] = None) -> List[Dict]:
+    """SuggestedRoute-shaped dicts for the ON_ROUTE vehicles in rows start:stop (default all)."""
+    va = VEHICLE_ARRAYS
+    stop = va.size if stop is None else min(stop, va.size)
+    routes = []
+    for row in (start + np.flatnonzero(va.state[start:stop] == STATE_ON_ROUTE)).tolist():
+        vehicle = VEHICLES_DB[va.ids[row]]
+        if vehicle.current_path:
+            routes.append({
+                "vehicle_id": vehicle.id,
+                "path": vehicle.current_path,
+                "estimated_travel_time": vehicle.path_cost or 0.0 # path_cost might be stale after partial travel
+            })
+    return routes
 
 async def simulation_loop():
     global SIMULATION_TIME, _stop_simulation
-    print("Simulation loop started.")
+    logger.info("Simulation loop started.")
     last_real_time = time.monotonic()
+    deadline = last_real_time
 
     while not _stop_simulation:
         current_real_time = time.monotonic()
@@ -46,121 +265,157 @@ async def simulation_loop():
         await update_vehicle_positions(simulated_time_this_step)
 
         # Check for rerouting needs (simplified: if vehicle is IDLE and has a destination)
-        for vehicle_id, vehicle in list(VEHICLES_DB.items()): # list() for safe iteration if modifying
-            if vehicle.state == VehicleStateEnum.IDLE and vehicle.destination_node_id != vehicle.current_node_id:
-                print(f"Vehicle {vehicle.id} is IDLE at {vehicle.current_node_id}, attempting to assign new route to {vehicle.destination_node_id}.")
-                routing_service.assign_route_to_vehicle(vehicle, VEHICLES_DB)
+        va = VEHICLE_ARRAYS
+        idle_rows = np.fromiter(sorted(IDLE_VEHICLE_ROWS), dtype=np.int64, count=len(IDLE_VEHICLE_ROWS))
+        idle_rows = idle_rows[va.node[idle_rows] != va.destination[idle_rows]]
+        if len(idle_rows): # Vehicles sharing a destination are routed by a single search
+            materialize_vehicles(idle_rows)
+            idle_vehicles = [VEHICLES_DB[va.ids[row]] for row in idle_rows.tolist()]
+            for vehicle in idle_vehicles:
+                logger.debug("Vehicle %s is IDLE at %s, attempting to assign new route to %s.", vehicle.id, vehicle.current_node_id, vehicle.destination_node_id)
+            # Searched in worker threads: requests (even a new map) can be served meanwhile
+            await routing_service.batch_assign_routes_concurrently(idle_vehicles, VEHICLES_DB)
+            for vehicle in idle_vehicles:
+                if VEHICLES_DB.get(vehicle.id) is vehicle:
+                    track_vehicle(vehicle)
 
 
-        # Ensure the loop runs roughly every SIMULATION_STEP_INTERVAL_SECONDS
-        # Adjust sleep time based on how long the current iteration took
-        # processing_time = time.monotonic() - current_real_time
-        # sleep_duration = max(0, SIMULATION_STEP_INTERVAL_SECONDS - processing_time)
-        # await asyncio.sleep(sleep_duration)
-        await asyncio.sleep(SIMULATION_STEP_INTERVAL_SECONDS) # Simpler fixed sleep
+        # Ensure the loop runs every SIMULATION_STEP_INTERVAL_SECONDS on average: sleep until the next
+        # deadline rather than a fixed interval, so time spent in the tick itself doesn't accumulate as drift.
+        # A tick that overran just yields; sleep(0) skips scheduling a timer.
+        deadline += SIMULATION_STEP_INTERVAL_SECONDS
+        delay = deadline - time.monotonic()
+        if delay < -SIMULATION_STEP_INTERVAL_SECONDS: # More than a whole step behind: don't burst to catch up
+            deadline -= delay
+        await asyncio.sleep(delay if delay > 0 else 0)
 
-    print("Simulation loop stopped.")
+    logger.info("Simulation loop stopped.")
 
 async def update_vehicle_positions(time_delta_simulated: float):
     """
-    Updates positions of all vehicles based on elapsed simulated time.
+    Updates positions of all vehicles based on elapsed simulated time, in one pass over VEHICLE_ARRAYS
+    (compiled with numba, or as vectorized NumPy without it). Road vehicle counts change as vehicles move,
+    but only as a per-tick delta per road: travel times are re-derived once at the end of the tick, for the
+    roads whose count actually changed (a vehicle leaving a road another one entered nets out).
     """
-    for vehicle_id, vehicle in list(VEHICLES_DB.items()): # Iterate over a copy for safe modification
-        if vehicle.state != VehicleStateEnum.ON_ROUTE or not vehicle.current_path:
+    global _vehicle_objects_stale
+    va = VEHICLE_ARRAYS
+    if not np.any(va.state[:va.size] == STATE_ON_ROUTE):
+        return
+    _vehicle_objects_stale = True
+    count_deltas = np.zeros(len(graph_manager.CURRENT_VEHICLES), dtype=np.int64)
+    step = _advance_vehicles if HAVE_NUMBA else _advance_vehicles_numpy
+    arrived = step(
+        va.size, va.time_on_segment, va.path_index, va.state, va.segment, va.node, va.destination,
+        va.path_start, va.path_len, va.path_edges, graph_manager.CURRENT_VEHICLES, graph_manager.CURRENT_TRAVEL_TIME,
+        graph_manager.EDGE_SRC, graph_manager.COL_IDX, time_delta_simulated, count_deltas
+    )
+    if logger.isEnabledFor(logging.DEBUG):
+        for row in arrived.tolist():
+            logger.debug("Vehicle %s arrived at destination %s.", va.ids[row], graph_manager.IDX_TO_NAME[va.destination[row]])
+
+    if count_deltas.any(): # One vectorized travel-time update for every road whose count changed this tick
+        graph_manager.recompute_travel_times(count_deltas)
+
+@njit(cache=True)
+def _advance_vehicles(size, time_on_segment, path_index, state, segment, node, destination, path_start, path_len,
+                      path_edges, vehicle_counts, travel_time, edge_src, edge_dst, dt, count_deltas):
+    """
+    Moves every ON_ROUTE row along its route by dt, adjusting road counts and adding each change to
+    count_deltas. Returns the rows that completed their last road.
+    """
+    # Vehicles at an intersection either have used up their route or enter its next road
+    for row in range(size):
+        if state[row] != STATE_ON_ROUTE:
+            continue
+        time_on_segment[row] += dt
+        if segment[row] >= 0:
+            continue
+        if path_index[row] >= path_len[row]:
+            state[row] = STATE_ARRIVED
+            node[row] = destination[row] # Ensure it's at final dest
             continue
+        edge = path_edges[path_start[row] + path_index[row]]
+        segment[row] = edge
+        node[row] = edge_src[edge] # Vehicle is now on this road, originating from its source
+        vehicle_counts[edge] += 1
+        count_deltas[edge] += 1
+
+    # Travel time for each vehicle's road from the graph (it's dynamic). graph_manager keeps it derived
+    # from congestion, which reflects vehicle counts as of the end of the previous tick.
+    # Vehicles that completed their road are now at its target intersection, ready for the next road next tick
+    arrived = np.empty(size, dtype=np.int64)
+    n_arrived = 0
+    for row in range(size):
+        edge = segment[row]
+        if state[row] != STATE_ON_ROUTE or edge < 0 or time_on_segment[row] < travel_time[edge]:
+            continue
+        vehicle_counts[edge] -= 1
+        count_deltas[edge] -= 1
+        path_index[row] += 1
+        node[row] = edge_dst[edge]
+        time_on_segment[row] = 0.0 # Reset for next segment
+        segment[row] = -1
+        if path_index[row] >= path_len[row]:
+            state[row] = STATE_ARRIVED
+            node[row] = destination[row]
+            arrived[n_arrived] = row
+            n_arrived += 1
+    # Counts are only clamped once every vehicle has entered and left, as a manual update may have set them low
+    for edge in range(count_deltas.shape[0]):
+        if count_deltas[edge] < 0 and vehicle_counts[edge] < 0:
+            vehicle_counts[edge] = 0
+    return arrived[:n_arrived]
+
+def _advance_vehicles_numpy(size, time_on_segment, path_index, state, segment, node, destination, path_start, path_len,
+                            path_edges, vehicle_counts, travel_time, edge_src, edge_dst, dt, count_deltas):
+    """_advance_vehicles as vectorized NumPy, for when numba is not installed."""
+    active = np.flatnonzero(state[:size] == STATE_ON_ROUTE)
+    time_on_segment[active] += dt
+
+    between = active[segment[active] < 0]
+    route_left = path_index[between] < path_len[between]
+    finished = between[~route_left]
+    state[finished] = STATE_ARRIVED
+    node[finished] = destination[finished]
+    entering = between[route_left]
+    entered_edges = path_edges[path_start[entering] + path_index[entering]]
+    segment[entering] = entered_edges
+    node[entering] = edge_src[entered_edges]
+    np.add.at(count_deltas, entered_edges, 1)
+    np.add.at(vehicle_counts, entered_edges, 1)
 
-        # Vehicle is on a route
-        vehicle.time_on_current_segment += time_delta_simulated
-
-        # Determine current road segment
-        if vehicle.current_path_index < len(vehicle.current_path) -1:
-            source_node = vehicle.current_path[vehicle.current_path_index]
-            target_node = vehicle.current_path[vehicle.current_path_index + 1]
-            current_road_key = (source_node, target_node)
-            
-            # If this is the first time processing this segment for the vehicle
-            if vehicle.current_road_segment != current_road_key:
-                if vehicle.current_road_segment: # Leaving an old road segment
-                    graph_manager.update_road_vehicle_count(vehicle.current_road_segment, -1)
-                
-                vehicle.current_road_segment = current_road_key
-                graph_manager.update_road_vehicle_count(vehicle.current_road_segment, +1)
-                vehicle.current_node_id = source_node # Vehicle is now on this road, originating from source_node
-                # print(f"Vehicle {vehicle.id} entered road {source_node}->{target_node}")
-
-            # Get travel time for this segment from the graph (it's dynamic)
-            try:
-                # graph_manager.CITY_GRAPH might not be updated immediately by update_road_vehicle_count
-                # due to how updates propagate. Safer to get it directly.
-                # travel_time_for_segment = graph_manager.CITY_GRAPH.edges[current_road_key]['current_travel_time']
-                
-                # Let's ensure we use the freshest data from ROAD_DATA which is updated by update_road_vehicle_count
-                if current_road_key in graph_manager.ROAD_DATA:
-                    base_time = graph_manager.ROAD_DATA[current_road_key]["base_travel_time"]
-                    congestion = graph_manager.ROAD_DATA[current_road_key]["current_congestion"]
-                    if congestion < 0.99:
-                        penalty_factor = 1 / (1 - congestion * 0.9)
-                    else:
-                        penalty_factor = 20
-                    travel_time_for_segment = base_time * penalty_factor
-                else: # Should not happen if pathing is correct
-                    print(f"Warning: Road data for {current_road_key} not found for vehicle {vehicle.id}. Using default time.")
-                    travel_time_for_segment = 1000 # Some large default
-
-            except KeyError:
-                print(f"Error: Edge {current_road_key} not found in graph for vehicle {vehicle.id}. Path: {vehicle.current_path}")
-                # This is a critical error, vehicle might get stuck. For now, make it take very long.
-                travel_time_for_segment = float('inf')
-
-
-            if vehicle.time_on_current_segment >= travel_time_for_segment:
-                # Vehicle has completed this segment
-                # print(f"Vehicle {vehicle.id} completed road {source_node}->{target_node} in {vehicle.time_on_current_segment:.2f}s (expected {travel_time_for_segment:.2f}s)")
-                
-                # Update vehicle state
-                vehicle.current_path_index += 1
-                vehicle.current_node_id = target_node # Arrived at the target_node of the segment
-                vehicle.time_on_current_segment = 0.0 # Reset for next segment
-                
-                # Remove from the completed road segment
-                graph_manager.update_road_vehicle_count(current_road_key, -1)
-                vehicle.current_road_segment = None # No longer on this specific segment
-
-                if vehicle.current_path_index >= len(vehicle.current_path) - 1:
-                    # Reached destination or end of current path segment list
-                    vehicle.state = VehicleStateEnum.ARRIVED
-                    vehicle.current_node_id = vehicle.destination_node_id # Ensure it's at final dest
-                    print(f"Vehicle {vehicle.id} arrived at destination {vehicle.destination_node_id}.")
-                else:
-                    # Still on route, will pick up next segment in next iteration
-                    # Vehicle is now at an intersection (target_node), ready for next segment
-                    # The next iteration will handle moving it to the next road
-                    vehicle.state = VehicleStateEnum.ON_ROUTE # Or IDLE if it needs to wait at intersection
-                    pass
-        else: # Should have been caught by ARRIVED state check
-            vehicle.state = VehicleStateEnum.ARRIVED
-            if vehicle.current_road_segment: # ensure it's removed from last road
-                 graph_manager.update_road_vehicle_count(vehicle.current_road_segment, -1)
-                 vehicle.current_road_segment = None
-
-        VEHICLES_DB[vehicle_id] = vehicle # Update the vehicle in the main DB
+    on_road = active[segment[active] >= 0]
+    completed = on_road[time_on_segment[on_road] >= travel_time[segment[on_road]]]
+    left_edges = segment[completed]
+    np.subtract.at(count_deltas, left_edges, 1)
+    np.subtract.at(vehicle_counts, left_edges, 1)
+    vehicle_counts[left_edges] = np.maximum(vehicle_counts[left_edges], 0)
+    path_index[completed] += 1
+    node[completed] = edge_dst[left_edges]
+    time_on_segment[completed] = 0.0
+    segment[completed] = -1
+    arrived = completed[path_index[completed] >= path_len[completed]]
+    state[arrived] = STATE_ARRIVED
+    node[arrived] = destination[arrived]
+    return arrived
 
 def start_simulation_task():
     global simulation_task, _stop_simulation
     if simulation_task is None or simulation_task.done():
         _stop_simulation = False
         simulation_task = asyncio.create_task(simulation_loop())
-        print("Simulation task created and started.")
+        logger.info("Simulation task created and started.")
     else:
-        print("Simulation task already running.")
+        logger.info("Simulation task already running.")
 
 def stop_simulation_task():
     global _stop_simulation
     _stop_simulation = True
     if simulation_task:
-        print("Stop signal sent to simulation task.")
+        logger.info("Stop signal sent to simulation task.")
     else:
-        print("No simulation task to stop.")
+        logger.info("No simulation task to stop.")
 
 def get_simulation_time():
     return SIMULATION_TIME
\ No newline at end of file
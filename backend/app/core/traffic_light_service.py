@@ -1,6 +1,10 @@
-from typing import Dict, List
-from app.core.graph_manager import get_roads_entering_intersection, ROAD_DATA, CITY_GRAPH,Optional
-from app.models import TrafficLightTiming
+import logging
+import numpy as np
+from typing import Dict, List, Optional
+from app.core import graph_manager
+from app.internal_models import TrafficLightTiming
+
+logger = logging.getLogger(__name__)
 
 # Basic traffic light control logic
 # This is a placeholder for more sophisticated logic (e.g., dynamic programming, adaptive algorithms)
@@ -8,6 +12,7 @@ from app.models import TrafficLightTiming
 # Example: Store cycle information per intersection
 # { "intersection_id": {"current_phase_index": 0, "phases": [{"road_id_green": "A-X", "duration": 30}, ...]} }
 INTERSECTION_PHASES: Dict[str, Dict] = {} 
+TIMINGS_VERSION: int = 0 # Bumped whenever some intersection's timings change (or the lights are reinitialized)
 
 MIN_GREEN_TIME = 10  # seconds
 MAX_GREEN_TIME = 60  # seconds
@@ -15,12 +20,13 @@ DEFAULT_CYCLE_TIME = 90 # Total time for all phases at an intersection
 
 def initialize_traffic_lights():
     """Initializes basic phase information for all intersections."""
-    global INTERSECTION_PHASES
+    global INTERSECTION_PHASES, TIMINGS_VERSION
     INTERSECTION_PHASES.clear()
-    if not CITY_GRAPH: # Ensure graph is loaded
+    TIMINGS_VERSION += 1
+    if not graph_manager.node_ids(): # Ensure graph is loaded
         return
 
-    for node_id in CITY_GRAPH.nodes():
+    for node_id in graph_manager.node_ids():
         # This is a very simplified phase generation.
         # Real intersections have complex phasing (left turns, pedestrian, etc.)
         # Here, we just alternate between major road groups if possible.
@@ -31,54 +37,48 @@ def initialize_traffic_lights():
             "timings_dirty": True, # Flag to recalculate
             "last_calculated_timings": {} # Store last calculated for output
         }
-    print(f"Traffic light controllers initialized for {len(INTERSECTION_PHASES)} intersections.")
+    logger.info("Traffic light controllers initialized for %d intersections.", len(INTERSECTION_PHASES))
 
 
-def calculate_adaptive_timings(intersection_id: str) -> Dict[str, int]:
+def _green_times() -> List[int]:
+    """
+    Green time for every road, indexed by edge id, for all intersections at once: per-intersection demand
+    totals are a bincount of road demand over the roads' target nodes.
+    """
+    # Demand score can be vehicle count, or weighted by congestion
+    # Simple: use vehicle count
+    # A more sensitive score:
+    # score = vehicle_count * (1 + congestion) # Higher score for more congested roads
+    demand = graph_manager.CURRENT_VEHICLES.astype(np.float64)
+    intersection = graph_manager.COL_IDX # Every road feeds the light at its target node
+    total_demand = np.bincount(intersection, weights=demand, minlength=len(graph_manager.IN_ROW_PTR) - 1)[intersection]
+    incoming_count = np.diff(graph_manager.IN_ROW_PTR)[intersection]
+
+    proportion = np.divide(demand, total_demand, out=np.zeros_like(demand), where=total_demand > 0)
+    green_time = (proportion * DEFAULT_CYCLE_TIME).astype(np.int64) # Total cycle time for this "phase group"
+    # No traffic at the intersection: equal share of the cycle, at least the minimum
+    equal_time = np.maximum(MIN_GREEN_TIME, DEFAULT_CYCLE_TIME // np.maximum(incoming_count, 1))
+    return np.where(total_demand > 0, np.clip(green_time, MIN_GREEN_TIME, MAX_GREEN_TIME), np.minimum(equal_time, MAX_GREEN_TIME)).tolist()
+
+
+def calculate_adaptive_timings(intersection_id: str, green_times: Optional[List[int]] = None) -> Dict[str, int]:
     """
     Calculates green light timings for an intersection based on current demand.
     This is a heuristic, not full DP, but adaptive.
+    green_times lets a caller refreshing many intersections share one _green_times() result.
     Returns: Dict mapping incoming road_id (e.g., "A-X") to green time.
     """
-    if intersection_id not in CITY_GRAPH.nodes():
-        return {}
-
-    incoming_roads = get_roads_entering_intersection(intersection_id)
-    if not incoming_roads:
+    node_idx = graph_manager.NAME_TO_IDX.get(intersection_id) # None for unknown intersections
+    incoming_edges = graph_manager.EDGES_ENTERING[node_idx] if node_idx is not None else None
+    if not incoming_edges:
+        if intersection_id in INTERSECTION_PHASES: # No roads to time, so it's as up to date as it gets
+            INTERSECTION_PHASES[intersection_id]["timings_dirty"] = False
         return {}
 
-    demand = {} # road_id -> demand_score (e.g., vehicle count or congestion * base_time)
-    total_demand_score = 0
-
-    for u, v in incoming_roads: # u is source, v is the intersection_id
-        road_key = (u,v)
-        if road_key in ROAD_DATA:
-            # Demand score can be vehicle count, or weighted by congestion
-            # Simple: use vehicle count
-            vehicle_count = ROAD_DATA[road_key].get("current_vehicles", 0)
-            # A more sensitive score:
-            # congestion = ROAD_DATA[road_key].get("current_congestion", 0)
-            # base_time = ROAD_DATA[road_key].get("base_travel_time", 1)
-            # score = vehicle_count * (1 + congestion) # Higher score for more congested roads
-            score = vehicle_count
-            
-            demand[f"{u}-{v}"] = score
-            total_demand_score += score
-        else:
-            demand[f"{u}-{v}"] = 0
-
-
-    timings: Dict[str, int] = {}
-    if total_demand_score == 0: # No traffic, assign default minimums or equal share
-        if incoming_roads:
-            equal_time = max(MIN_GREEN_TIME, DEFAULT_CYCLE_TIME // len(incoming_roads))
-            for u,v in incoming_roads:
-                timings[f"{u}-{v}"] = min(equal_time, MAX_GREEN_TIME)
-    else:
-        for road_id_str, score in demand.items():
-            proportion = score / total_demand_score
-            green_time = int(proportion * DEFAULT_CYCLE_TIME) # Total cycle time for this "phase group"
-            timings[road_id_str] = max(MIN_GREEN_TIME, min(green_time, MAX_GREEN_TIME))
+    if green_times is None:
+        green_times = _green_times()
+    road_ids = graph_manager.EDGE_ID_STR
+    timings: Dict[str, int] = {road_ids[edge_idx]: green_times[edge_idx] for edge_idx in incoming_edges}
     
     # This simple model assumes all incoming roads can be green somewhat independently
     # or grouped. A real system uses fixed phases (e.g. NS green, EW green).
@@ -89,27 +89,47 @@ def calculate_adaptive_timings(intersection_id: str) -> Dict[str, int]:
     
     # For now, let's assume the above `timings` dict is what we want.
     if intersection_id in INTERSECTION_PHASES: # Should always be true after init
+        global TIMINGS_VERSION
+        if timings != INTERSECTION_PHASES[intersection_id]["last_calculated_timings"]:
+            TIMINGS_VERSION += 1
         INTERSECTION_PHASES[intersection_id]["last_calculated_timings"] = timings
         INTERSECTION_PHASES[intersection_id]["timings_dirty"] = False
 
     return timings
 
 
+def _mark_changed_intersections_dirty():
+    """Marks dirty every intersection whose incoming road counts changed since the last call."""
+    changed = graph_manager.INCOMING_COUNT_CHANGED
+    if not changed.any():
+        return
+    names = graph_manager.IDX_TO_NAME
+    for node_idx in np.flatnonzero(changed).tolist():
+        phase_data = INTERSECTION_PHASES.get(names[node_idx])
+        if phase_data is not None:
+            phase_data["timings_dirty"] = True
+    changed[:] = False
+
+
 def get_traffic_light_timings_for_intersection(intersection_id: str) -> Optional[TrafficLightTiming]:
+    _mark_changed_intersections_dirty()
+    return _timings_for_intersection(intersection_id)
+
+
+def _timings_for_intersection(intersection_id: str, green_times: Optional[List[int]] = None) -> Optional[TrafficLightTiming]:
     if intersection_id not in INTERSECTION_PHASES:
         initialize_traffic_lights() # Attempt to initialize if not done
     
     if intersection_id not in INTERSECTION_PHASES: # Still not found
-         print(f"Intersection {intersection_id} not found for traffic lights.")
+         logger.warning("Intersection %s not found for traffic lights.", intersection_id)
          return None
 
-    # Recalculate if marked dirty or if no timings exist yet
-    # In a real system, this would be triggered by traffic updates periodically
-    # if INTERSECTION_PHASES[intersection_id]["timings_dirty"] or \
-    #    not INTERSECTION_PHASES[intersection_id]["last_calculated_timings"]:
-    calculated_timings = calculate_adaptive_timings(intersection_id)
-    # else:
-    #    calculated_timings = INTERSECTION_PHASES[intersection_id]["last_calculated_timings"]
+    # Recalculate if marked dirty (an incoming road's count changed, or mark_all_lights_dirty) or if no timings exist yet
+    phase_data = INTERSECTION_PHASES[intersection_id]
+    if phase_data["timings_dirty"] or not phase_data["last_calculated_timings"]:
+        calculated_timings = calculate_adaptive_timings(intersection_id, green_times)
+    else:
+        calculated_timings = phase_data["last_calculated_timings"]
     
     if calculated_timings:
         return TrafficLightTiming(intersection_id=intersection_id, green_times=calculated_timings)
@@ -118,15 +138,38 @@ def get_traffic_light_timings_for_intersection(intersection_id: str) -> Optional
 
 def get_all_traffic_light_timings() -> List[TrafficLightTiming]:
     all_timings = []
-    if not INTERSECTION_PHASES and CITY_GRAPH.nodes(): # Initialize if empty but graph exists
-        initialize_traffic_lights()
+    green_times = _refresh_all_timings()
         
-    for intersection_id in CITY_GRAPH.nodes(): # Iterate over actual graph nodes
-        timings = get_traffic_light_timings_for_intersection(intersection_id)
+    for intersection_id in graph_manager.node_ids(): # Iterate over actual graph nodes
+        timings = _timings_for_intersection(intersection_id, green_times)
         if timings:
             all_timings.append(timings)
     return all_timings
 
+
+def _refresh_all_timings() -> Optional[List[int]]:
+    """Recalculates every dirty intersection. Returns the _green_times() used, or None if none was dirty."""
+    if not INTERSECTION_PHASES and graph_manager.node_ids(): # Initialize if empty but graph exists
+        initialize_traffic_lights()
+    _mark_changed_intersections_dirty()
+    # Computed for every road at once if any intersection needs refreshing
+    if not any(data["timings_dirty"] for data in INTERSECTION_PHASES.values()):
+        return None
+    green_times = _green_times()
+    for intersection_id, data in INTERSECTION_PHASES.items():
+        if data["timings_dirty"]:
+            calculate_adaptive_timings(intersection_id, green_times)
+    return green_times
+
+
+def timings_version() -> int:
+    """
+    TIMINGS_VERSION once every intersection is up to date: while it stays the same,
+    get_all_traffic_light_timings returns the same timings.
+    """
+    _refresh_all_timings()
+    return TIMINGS_VERSION
+
 def mark_all_lights_dirty():
     """ Call this after significant traffic updates to force recalculation. """
     for data in INTERSECTION_PHASES.values():
@@ -0,0 +1,29 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+from app.models import VehicleStateEnum
+
+# Internal counterparts of the app.models schemas for objects the simulation keeps around or builds in bulk.
+# Slotted dataclasses: no validation on every assignment and no per-instance __dict__. Pydantic stays at
+# the HTTP boundary, where FastAPI converts these to the response_model on the way out.
+
+@dataclass(slots=True)
+class Vehicle:
+    id: str
+    start_node_id: str # Original start
+    destination_node_id: str # Final destination
+
+    # Dynamic state for simulation
+    current_node_id: str # Current intersection if idle/arrived, or start of current_road_segment if on_route
+    current_road_segment: Optional[Tuple[str, str]] = None # (source, target) of the road currently on
+    time_on_current_segment: float = 0.0 # Simulated seconds spent on current_road_segment
+    current_path_index: int = 0 # Index of the next node in current_path to reach
+    state: str = VehicleStateEnum.IDLE
+
+    # Path information
+    current_path: Optional[List[str]] = None # List of node IDs forming the path
+    path_cost: Optional[float] = None # Total estimated time for current_path
+
+@dataclass(slots=True)
+class TrafficLightTiming:
+    intersection_id: str
+    green_times: Dict[str, int] # road_id entering intersection -> green_seconds
@@ -1,64 +1,84 @@
-from fastapi import FastAPI, HTTPException, Body
-from fastapi.middleware.cors import CORSMiddleware
-from typing import List, Dict, Optional
+import asyncio
+import logging
+import time
+import orjson
+from fastapi import FastAPI, HTTPException, Body, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from typing import List, Dict, Optional, Tuple
 
 from app.models import (
-    CityMap, TrafficUpdate, RouteRequest, SuggestedRoute,
+    CityMap, TrafficUpdate, RouteRequest,
     TrafficLightTiming, SystemState, Vehicle, VehicleStateEnum
 )
 from app.core import graph_manager, routing_service, traffic_light_service, simulation_manager
+from app import internal_models
+from app.middleware import AllowAllCORSMiddleware
+
+# Core modules log through logging; per-vehicle/per-road chatter is at DEBUG and is skipped cheaply at INFO
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
 
 app = FastAPI(title="Smart Traffic Management System API")
 
+# Any origin, method and header, with credentials (see app.middleware)
 app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    AllowAllCORSMiddleware,
+    expose_headers=["X-Total-Count"], # Lets the browser read the total behind a /vehicles page
 )
 
 # Global in-memory database for vehicles (passed to simulation_manager)
-VEHICLES_DB: Dict[str, Vehicle] = {}
+# Only used from the event loop, and nothing awaits partway through changing it, so each change is atomic
+# without a lock. Code that awaits between reading and writing a vehicle (the reroute search, the
+# simulation's routing phase) checks afterwards that the vehicle is still the one in here and where it was.
+VEHICLES_DB: Dict[str, internal_models.Vehicle] = {}
+
+# Serialized snapshots of the read-mostly endpoints, as (version of the data, JSON), and the ETag salt
+# that keeps a client's tags from a previous server process from matching
+_LIGHTS_JSON = (-1, b"")
+_CONDITIONS_JSON = (-1, b"")
+ETAG_SALT = "%x" % time.time_ns()
 
 @app.on_event("startup")
 async def startup_event():
-    print("Smart Traffic API starting up...")
+    logger.info("Smart Traffic API starting up...")
     # Load a default map if desired, e.g.:
     # from app.data.load_default_map import default_map_data # You'd create this
     # if graph_manager.load_map(CityMap(**default_map_data)):
     #     traffic_light_service.initialize_traffic_lights()
     simulation_manager.initialize_simulation(VEHICLES_DB)
     simulation_manager.start_simulation_task() # Start the simulation loop
-    print("Smart Traffic API startup complete.")
+    logger.info("Smart Traffic API startup complete.")
 
 @app.on_event("shutdown")
 async def shutdown_event():
-    print("Smart Traffic API shutting down...")
+    logger.info("Smart Traffic API shutting down...")
     simulation_manager.stop_simulation_task()
     # Give the simulation task a moment to finish
     if simulation_manager.simulation_task and not simulation_manager.simulation_task.done():
         try:
             await asyncio.wait_for(simulation_manager.simulation_task, timeout=5.0)
         except asyncio.TimeoutError:
-            print("Simulation task did not finish in time, cancelling.")
+            logger.warning("Simulation task did not finish in time, cancelling.")
             simulation_manager.simulation_task.cancel()
-    print("Smart Traffic API shutdown complete.")
+    logger.info("Smart Traffic API shutdown complete.")
 
 
 @app.post("/map/load", status_code=201)
 async def load_city_map(city_map_data: CityMap): # Renamed for clarity
-    if graph_manager.load_map(city_map_data):
+    # Building the graph (and its contraction hierarchy) can take seconds on a large map: do it in a worker
+    # thread so the simulation and other requests keep running on the old map, then swap it in here
+    prepared = await asyncio.to_thread(graph_manager.prepare_map, city_map_data)
+    if graph_manager.install_map(prepared):
         traffic_light_service.initialize_traffic_lights()
+        routing_service.clear_route_cache()
         # Clear vehicles or re-evaluate their positions based on new map?
         # For simplicity, let's clear them for now.
         global VEHICLES_DB
-        # Before clearing, ensure vehicles are removed from old road counts
-        for v_id, v_obj in list(VEHICLES_DB.items()):
-            if v_obj.current_road_segment:
-                graph_manager.update_road_vehicle_count(v_obj.current_road_segment, -1)
+        # The new map starts with empty roads, so there are no old road counts to remove vehicles from
         VEHICLES_DB.clear() 
+        simulation_manager.clear_vehicles()
         simulation_manager.SIMULATION_TIME = 0.0 # Reset sim time
+        _conditions_json() # Serialized now, so the map view's first poll of the new map is just a send
         return {"message": "City map loaded successfully. Existing vehicles cleared."}
     else:
         raise HTTPException(status_code=500, detail="Failed to load city map.")
@@ -66,22 +86,31 @@ async def load_city_map(city_map_data: CityMap): # Renamed for clarity
 @app.put("/traffic/update", status_code=200) # Manual traffic update
 async def update_road_traffic_manual(updates: List[TrafficUpdate]):
     results = []
-    updated_something = False
+    found = [] # (edge id, update) of the roads that exist, applied together below
+    edge_for_road_id, add_result = graph_manager.edge_for_road_id, results.append # Bound once for bulk updates
     for update in updates:
-        # This manual update will set congestion directly OR derive from vehicle_count
-        if graph_manager.update_traffic_on_road(
-            update.road_id, 
-            congestion_level=update.congestion_level, 
-            vehicle_count=getattr(update, 'vehicle_count', None) # Use getattr for optional field
-        ):
-            results.append({"road_id": update.road_id, "status": "updated"})
-            updated_something = True
+        road_id = update.road_id
+        edge_idx = edge_for_road_id(road_id)
+        if edge_idx is not None:
+            add_result({"road_id": road_id, "status": "updated"})
+            found.append((edge_idx, update))
         else:
-            results.append({"road_id": update.road_id, "status": "failed or road not found"})
+            add_result({"road_id": road_id, "status": "failed or road not found"})
     
-    if updated_something:
+    if found:
+        # This manual update will set congestion directly OR derive from vehicle_count
+        graph_manager.update_traffic_bulk(
+            [edge_idx for edge_idx, _ in found],
+            [update.congestion_level for _, update in found],
+            [update.vehicle_count for _, update in found]
+        )
         traffic_light_service.mark_all_lights_dirty()
-    return {"message": "Manual traffic update processed.", "details": results}
+        graph_manager.bump_route_epoch() # Manual updates are routed around right away, however small
+    # One status per road, so the reply grows with the batch: orjson rather than jsonable_encoder and stdlib json
+    return Response(
+        orjson.dumps({"message": "Manual traffic update processed.", "details": results}),
+        media_type="application/json"
+    )
 
 
 @app.post("/vehicles", response_model=Vehicle, status_code=201)
@@ -90,11 +119,11 @@ async def add_vehicle_endpoint(vehicle_data: RouteRequest): # Use RouteRequest t
     if vehicle_id in VEHICLES_DB:
         raise HTTPException(status_code=400, detail=f"Vehicle with ID {vehicle_id} already exists.")
 
-    if not graph_manager.CITY_GRAPH.has_node(vehicle_data.start_node_id) or \
-       not graph_manager.CITY_GRAPH.has_node(vehicle_data.end_node_id):
+    if not graph_manager.has_node(vehicle_data.start_node_id) or \
+       not graph_manager.has_node(vehicle_data.end_node_id):
         raise HTTPException(status_code=404, detail="Start or end node for vehicle not found in map.")
 
-    new_vehicle = Vehicle(
+    new_vehicle = internal_models.Vehicle(
         id=vehicle_id,
         start_node_id=vehicle_data.start_node_id,
         destination_node_id=vehicle_data.end_node_id,
@@ -102,83 +131,148 @@ async def add_vehicle_endpoint(vehicle_data: RouteRequest): # Use RouteRequest t
         state=VehicleStateEnum.IDLE # Will be routed by simulation or next call
     )
     VEHICLES_DB[vehicle_id] = new_vehicle
+    simulation_manager.track_vehicle(new_vehicle)
     
     # Attempt initial routing immediately (optional, sim loop can also pick it up)
     # routing_service.assign_route_to_vehicle(new_vehicle, VEHICLES_DB)
-    print(f"Vehicle {vehicle_id} added. State: {new_vehicle.state}. Current node: {new_vehicle.current_node_id}")
-    return new_vehicle
+    logger.debug("Vehicle %s added. State: %s. Current node: %s", vehicle_id, new_vehicle.state, new_vehicle.current_node_id)
+    return _vehicle_response(new_vehicle, status_code=201)
 
 @app.post("/vehicles/{vehicle_id}/reroute", response_model=Vehicle)
 async def reroute_vehicle_endpoint(vehicle_id: str, new_start_node_id: Optional[str] = Body(None, embed=True)):
     if vehicle_id not in VEHICLES_DB:
         raise HTTPException(status_code=404, detail=f"Vehicle {vehicle_id} not found.")
     
+    simulation_manager.materialize_vehicle(vehicle_id)
     vehicle = VEHICLES_DB[vehicle_id]
+    start_node_id = vehicle.current_node_id
+    if new_start_node_id and graph_manager.has_node(new_start_node_id):
+        start_node_id = new_start_node_id
+    # If no new_start_node_id, it will try to reroute from its last known current_node_id
+
+    # Search in a worker thread so the simulation loop and other requests keep running meanwhile.
+    # The vehicle itself is only changed afterwards, back on the event loop.
+    path_info = await asyncio.to_thread(routing_service.find_fastest_path_from, start_node_id, vehicle.destination_node_id)
+    if VEHICLES_DB.get(vehicle_id) is not vehicle: # A new map was loaded while searching
+        raise HTTPException(status_code=404, detail=f"Vehicle {vehicle_id} not found.")
+    simulation_manager.materialize_vehicle(vehicle_id) # It may have moved while the search ran
     
     # If vehicle was on a road, remove it from that road's count
-    if vehicle.current_road_segment:
-        graph_manager.update_road_vehicle_count(vehicle.current_road_segment, -1)
-        vehicle.current_road_segment = None
+    simulation_manager.remove_from_road(vehicle)
 
     vehicle.state = VehicleStateEnum.IDLE
-    if new_start_node_id and graph_manager.CITY_GRAPH.has_node(new_start_node_id):
-        vehicle.current_node_id = new_start_node_id
-    # If no new_start_node_id, it will try to reroute from its last known current_node_id
-    
+    vehicle.current_node_id = start_node_id
     vehicle.current_path = None # Clear old path
     vehicle.current_path_index = 0
     vehicle.time_on_current_segment = 0.0
     
-    # The simulation loop will pick up IDLE vehicles and try to assign_route_to_vehicle
-    # Or, we can trigger it here:
-    if routing_service.assign_route_to_vehicle(vehicle, VEHICLES_DB):
-        return vehicle
+    routed = routing_service.apply_path(vehicle, path_info, VEHICLES_DB)
+    simulation_manager.track_vehicle(vehicle)
+    if routed:
+        return _vehicle_response(vehicle)
     else:
         # Keep it IDLE if routing failed, sim loop might try again later
-        VEHICLES_DB[vehicle_id] = vehicle # Save state changes
         raise HTTPException(status_code=500, detail=f"Failed to find a new route for vehicle {vehicle_id} immediately. It remains IDLE.")
 
 
 @app.get("/vehicles", response_model=List[Vehicle])
-async def get_all_vehicles_endpoint():
-    return list(VEHICLES_DB.values())
+async def get_all_vehicles_endpoint(offset: int = Query(0, ge=0), limit: int = Query(500, ge=1, le=5000)):
+    # One page of vehicles (in the order they were added), so a large fleet isn't serialized in one go;
+    # X-Total-Count has the fleet size for paging through the rest.
+    # Plain dicts from the simulation arrays through orjson: no Vehicle validation or jsonable_encoder per vehicle
+    return Response(
+        orjson.dumps(simulation_manager.vehicle_dicts(offset, offset + limit)),
+        media_type="application/json",
+        headers={"X-Total-Count": str(len(VEHICLES_DB))}
+    )
 
 @app.get("/vehicles/{vehicle_id}", response_model=Vehicle)
 async def get_vehicle_details_endpoint(vehicle_id: str):
     if vehicle_id not in VEHICLES_DB:
         raise HTTPException(status_code=404, detail=f"Vehicle {vehicle_id} not found.")
-    return VEHICLES_DB[vehicle_id]
+    simulation_manager.materialize_vehicle(vehicle_id)
+    return _vehicle_response(VEHICLES_DB[vehicle_id])
+
+def _vehicle_response(vehicle: internal_models.Vehicle, status_code: int = 200) -> Response:
+    # The simulation's own Vehicle already has the schema's fields and types: orjson serializes the dataclass
+    # as is, instead of FastAPI validating it into the response_model first (kept for the API docs)
+    return Response(orjson.dumps(vehicle), status_code=status_code, media_type="application/json")
 
 
 @app.get("/traffic-lights", response_model=List[TrafficLightTiming])
-async def get_all_light_timings_endpoint():
-    timings = traffic_light_service.get_all_traffic_light_timings()
-    return timings
+async def get_all_light_timings_endpoint(request: Request):
+    # Already valid timings, so straight through orjson rather than response_model validation
+    version, payload = _lights_json()
+    return _json_with_etag(request, f'W/"lights-{ETAG_SALT}-{version}"', payload)
+
+def _lights_json():
+    """(timings version, /traffic-lights JSON), serialized again only once some timing has changed."""
+    global _LIGHTS_JSON
+    version = traffic_light_service.timings_version()
+    if _LIGHTS_JSON[0] != version:
+        lights = [
+            {"intersection_id": light.intersection_id, "green_times": light.green_times}
+            for light in traffic_light_service.get_all_traffic_light_timings()
+        ]
+        _LIGHTS_JSON = (version, orjson.dumps(lights))
+    return _LIGHTS_JSON
+
+def _json_with_etag(request: Request, etag: str, payload: bytes) -> Response:
+    """The JSON payload tagged with etag, or an empty 304 if the client already has it."""
+    if etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(payload, media_type="application/json", headers={"ETag": etag})
+
+STATE_STREAM_BATCH_SIZE = 1000 # Vehicles serialized per chunk of a streamed /system/state
 
 @app.get("/system/state", response_model=SystemState)
 async def get_current_system_state_endpoint():
     # Suggested routes are now part of individual vehicle objects
     # We can compile a list of routes from active vehicles if needed for this specific output
-    active_routes = []
-    for v_id, v_obj in VEHICLES_DB.items():
-        if v_obj.current_path and v_obj.state == VehicleStateEnum.ON_ROUTE:
-            active_routes.append(SuggestedRoute(
-                vehicle_id=v_id,
-                path=v_obj.current_path,
-                estimated_travel_time=v_obj.path_cost or 0.0 # path_cost might be stale after partial travel
-            ))
-
-    lights = traffic_light_service.get_all_traffic_light_timings()
-    return SystemState(
-        routes=active_routes, # Or remove routes from SystemState model if vehicles list is enough
-        traffic_lights=lights,
-        vehicles=list(VEHICLES_DB.values()),
-        simulation_time=simulation_manager.get_simulation_time()
-    )
+    # Polled by the frontend, so the state is streamed: orjson serializes the vehicles a batch at a time straight
+    # from the simulation arrays, instead of building and validating a SystemState for the whole fleet at once.
+    # The response_model above still documents the shape.
+    return StreamingResponse(_stream_system_state(), media_type="application/json")
+
+async def _stream_system_state():
+    vehicle_arrays = simulation_manager.VEHICLE_ARRAYS # Replaced if a new map is loaded mid-stream; stop there
+    batches = range(0, vehicle_arrays.size, STATE_STREAM_BATCH_SIZE)
+
+    yield b'{"routes":['
+    separator = b""
+    for start in batches:
+        if simulation_manager.VEHICLE_ARRAYS is not vehicle_arrays:
+            break
+        routes = simulation_manager.route_dicts(start, start + STATE_STREAM_BATCH_SIZE)
+        if routes:
+            yield separator + orjson.dumps(routes)[1:-1] # Items without the list brackets
+            separator = b","
+
+    yield b'],"traffic_lights":' + _lights_json()[1] + b',"vehicles":['
+
+    separator = b""
+    for start in batches:
+        if simulation_manager.VEHICLE_ARRAYS is not vehicle_arrays:
+            break
+        vehicles = simulation_manager.vehicle_dicts(start, start + STATE_STREAM_BATCH_SIZE)
+        if vehicles:
+            yield separator + orjson.dumps(vehicles)[1:-1]
+            separator = b","
+    yield b'],"simulation_time":' + orjson.dumps(simulation_manager.get_simulation_time()) + b"}"
 
 @app.get("/map/roads/conditions")
-async def get_road_conditions_endpoint():
-    return graph_manager.get_current_road_conditions()
+async def get_road_conditions_endpoint(request: Request):
+    # Polled by the map view every few seconds; orjson skips jsonable_encoder and stdlib json, and
+    # the result is reused until some road's traffic changes
+    version, payload = _conditions_json()
+    return _json_with_etag(request, f'W/"roads-{ETAG_SALT}-{version}"', payload)
+
+def _conditions_json() -> Tuple[int, bytes]:
+    global _CONDITIONS_JSON
+    version = graph_manager.TRAFFIC_VERSION
+    if _CONDITIONS_JSON[0] != version:
+        _CONDITIONS_JSON = (version, orjson.dumps(graph_manager.get_current_road_conditions()))
+    return _CONDITIONS_JSON
 
 # Placeholder for a default map if you want to load one on startup
 # You would create a maps.py or similar in app/data/
@@ -188,4 +282,17 @@ async def get_road_conditions_endpoint():
 #     if graph_manager.load_map(CityMap(**maps.BASIC_MAP)):
 #        traffic_light_service.initialize_traffic_lights()
 #        simulation_manager.initialize_simulation(VEHICLES_DB)
-#        simulation_manager.start_simulation_task()
\ No newline at end of file
+#        simulation_manager.start_simulation_task()
+
+if __name__ == "__main__": # python -m app.main, from backend/
+    import os
+    import uvicorn
+    # uvloop and httptools (both in uvicorn[standard]) instead of the pure-Python asyncio loop and h11 parser.
+    # A single process on purpose: the map, vehicles and simulation live in this process's memory.
+    uvicorn.run(
+        "app.main:app",
+        host=os.getenv("HOST", "0.0.0.0"),
+        port=int(os.getenv("PORT", "8000")),
+        loop=os.getenv("UVICORN_LOOP", "uvloop"), # uvloop has no Windows build; set UVICORN_LOOP=asyncio there
+        http="httptools",
+    )
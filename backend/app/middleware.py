@@ -0,0 +1,62 @@
+from typing import Iterable
+
+# CORS for this API's allow-everything policy (any origin, method and header, with credentials), as a bare
+# ASGI wrapper: the request headers are scanned once and the CORS headers appended to the raw header list,
+# without the Headers/MutableHeaders objects a configurable middleware builds on every request.
+# Responds like Starlette's CORSMiddleware(allow_origins=["*"], allow_methods=["*"], allow_headers=["*"],
+# allow_credentials=True): with credentials allowed, the request's Origin is echoed rather than "*".
+
+PREFLIGHT_METHODS = b"DELETE, GET, HEAD, OPTIONS, PATCH, POST, PUT"
+PREFLIGHT_MAX_AGE = b"600"
+
+class AllowAllCORSMiddleware:
+    def __init__(self, app, expose_headers: Iterable[str] = ()):
+        self.app = app
+        self.response_headers = [(b"access-control-allow-credentials", b"true")]
+        if expose_headers:
+            self.response_headers.append((b"access-control-expose-headers", ", ".join(expose_headers).encode("latin-1")))
+        self.response_headers.append((b"vary", b"Origin"))
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        origin = requested_method = requested_headers = None
+        for name, value in scope["headers"]:
+            if name == b"origin":
+                origin = value
+            elif name == b"access-control-request-method":
+                requested_method = value
+            elif name == b"access-control-request-headers":
+                requested_headers = value
+        if origin is None: # Not a cross-origin request, but a cached copy of the response might serve one later
+            cors_headers = [(b"vary", b"Origin")]
+        elif scope["method"] == "OPTIONS" and requested_method is not None:
+            await self._preflight(send, origin, requested_headers)
+            return
+        else:
+            cors_headers = [(b"access-control-allow-origin", origin), *self.response_headers]
+
+        async def send_with_cors(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", ()), *cors_headers]
+            await send(message)
+
+        await self.app(scope, receive, send_with_cors)
+
+    @staticmethod
+    async def _preflight(send, origin: bytes, requested_headers):
+        headers = [
+            (b"access-control-allow-origin", origin),
+            (b"access-control-allow-methods", PREFLIGHT_METHODS),
+            (b"access-control-max-age", PREFLIGHT_MAX_AGE),
+            (b"access-control-allow-credentials", b"true"),
+            (b"vary", b"Origin, Access-Control-Request-Method, Access-Control-Request-Headers"),
+            (b"content-type", b"text/plain; charset=utf-8"),
+            (b"content-length", b"2"),
+        ]
+        if requested_headers is not None: # Every header is allowed, so the requested ones are mirrored back
+            headers.append((b"access-control-allow-headers", requested_headers))
+        await send({"type": "http.response.start", "status": 200, "headers": headers})
+        await send({"type": "http.response.body", "body": b"OK"})
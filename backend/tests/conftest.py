@@ -0,0 +1,28 @@
+import random
+
+import pytest
+
+from app.core import graph_manager
+from app.models import CityMap
+
+
+def grid_map(n: int, seed: int = 0) -> CityMap:
+    """An n x n grid of intersections N{i}_{j}, with a road each way between neighbours and random travel times."""
+    rnd = random.Random(seed)
+    nodes = [{"id": f"N{i}_{j}", "name": f"n{i}{j}", "x": i * 100.0, "y": j * 100.0} for i in range(n) for j in range(n)]
+    edges = [
+        {"source": f"N{i}_{j}", "target": f"N{i + di}_{j + dj}",
+         "base_travel_time": rnd.uniform(100, 300), "capacity": rnd.randint(1, 5)}
+        for i in range(n) for j in range(n)
+        for di, dj in ((1, 0), (0, 1), (-1, 0), (0, -1))
+        if 0 <= i + di < n and 0 <= j + dj < n
+    ]
+    return CityMap(nodes=nodes, edges=edges)
+
+
+@pytest.fixture
+def load_grid():
+    """Loads grid_map(n, seed) into graph_manager."""
+    def load(n: int, seed: int = 0):
+        assert graph_manager.load_map(grid_map(n, seed))
+    return load
@@ -0,0 +1,41 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from conftest import grid_map
+
+
+@pytest.fixture
+def client():
+    with TestClient(app) as client: # Runs the startup and shutdown events
+        yield client
+
+
+def test_traffic_lights_not_modified_until_timings_change(client):
+    assert client.post("/map/load", json=grid_map(3).model_dump()).status_code == 201
+    response = client.get("/traffic-lights")
+    etag = response.headers["etag"]
+
+    cached = client.get("/traffic-lights", headers={"If-None-Match": etag})
+    assert cached.status_code == 304 and cached.content == b""
+
+    assert client.put("/traffic/update", json=[{"road_id": "N0_0-N0_1", "vehicle_count": 30}]).status_code == 200
+    changed = client.get("/traffic-lights", headers={"If-None-Match": etag})
+    assert changed.status_code == 200 and changed.headers["etag"] != etag
+    assert changed.json() != response.json()
+
+
+def test_cors_preflight(client):
+    response = client.options("/vehicles", headers={
+        "Origin": "http://example.com", "Access-Control-Request-Method": "POST",
+        "Access-Control-Request-Headers": "content-type, x-foo",
+    })
+    assert response.status_code == 200 and response.text == "OK"
+    assert response.headers["access-control-allow-origin"] == "http://example.com" # Echoed, as credentials are allowed
+    assert response.headers["access-control-allow-credentials"] == "true"
+    assert response.headers["access-control-allow-headers"] == "content-type, x-foo"
+    assert "POST" in response.headers["access-control-allow-methods"]
+
+    response = client.get("/traffic-lights", headers={"Origin": "http://example.com"})
+    assert response.headers["access-control-allow-origin"] == "http://example.com"
+    assert response.headers["access-control-expose-headers"] == "X-Total-Count"
@@ -0,0 +1,62 @@
+# Run from backend/: python -m pytest -q
+import random
+
+import numpy as np
+import pytest
+
+from app.core import contraction
+from app.core.dijkstra_nb import dijkstra_csr
+
+NO_POSITIONS = np.zeros((0, 2)) # h_scale 0 makes dijkstra_csr plain Dijkstra, which never reads positions
+
+
+def random_graph(rnd: random.Random, n: int, m: int):
+    """CSR arrays (row_ptr, edge_src, col_idx) of a random directed graph, self-loops and disconnected parts included."""
+    pairs = dict.fromkeys((rnd.randrange(n), rnd.randrange(n)) for _ in range(m))
+    src = np.array([u for u, _ in pairs], dtype=np.int64)
+    dst = np.array([v for _, v in pairs], dtype=np.int64)
+    order = np.argsort(src, kind="stable")
+    src, dst = src[order], dst[order]
+    row_ptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=n), out=row_ptr[1:])
+    return row_ptr, src, dst
+
+
+def random_weights(rnd: random.Random, m: int) -> np.ndarray:
+    # Some zero-weight edges, so ties between equally short paths come up too
+    return np.array([0.0 if rnd.random() < 0.05 else rnd.uniform(1, 100) for _ in range(m)])
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_shortest_path_matches_dijkstra(seed):
+    rnd = random.Random(seed)
+    n = rnd.randint(1, 40)
+    row_ptr, src, dst = random_graph(rnd, n, rnd.randint(0, 4 * n))
+    hierarchy = contraction.build(n, src, dst)
+    edge_of = {(u, v): e for e, (u, v) in enumerate(zip(src.tolist(), dst.tolist()))}
+
+    for _ in range(2): # Same hierarchy, new weights: only the customization changes
+        weights = random_weights(rnd, len(src))
+        metric = contraction.customize(hierarchy, weights)
+        for s in range(n):
+            for t in range(n):
+                path, cost = contraction.shortest_path(hierarchy, metric, s, t)
+                expected_path, expected_cost = dijkstra_csr(row_ptr, dst, weights, s, t, NO_POSITIONS, 0.0)
+                if len(expected_path) == 0:
+                    assert len(path) == 0 and cost == np.inf
+                    continue
+                assert cost == pytest.approx(expected_cost, rel=1e-9, abs=1e-9)
+                assert path[0] == s and path[-1] == t
+                # The unpacked path is made of real edges and adds up to the reported cost
+                path_cost = sum(weights[edge_of[(u, v)]] for u, v in zip(path[:-1].tolist(), path[1:].tolist()))
+                assert path_cost == pytest.approx(cost, rel=1e-9, abs=1e-9)
+
+
+def test_build_gives_up_above_the_caps(monkeypatch):
+    rnd = random.Random(0)
+    row_ptr, src, dst = random_graph(rnd, 30, 120)
+    assert contraction.build(30, src, dst) is not None
+    monkeypatch.setattr(contraction, "MAX_CONTRACTION_TRIANGLES", 0)
+    assert contraction.build(30, src, dst) is None
+    monkeypatch.setattr(contraction, "MAX_CONTRACTION_NODES", 29)
+    assert contraction.build(30, src, dst) is None
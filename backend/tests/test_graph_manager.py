@@ -0,0 +1,32 @@
+import random
+
+import numpy as np
+import pytest
+
+from app.core import graph_manager
+
+
+def traffic_state():
+    return graph_manager.CURRENT_VEHICLES.copy(), graph_manager.CURRENT_CONGESTION.copy(), graph_manager.CURRENT_TRAVEL_TIME.copy()
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_bulk_update_matches_per_road_updates(load_grid, seed):
+    load_grid(5, seed)
+    rnd = random.Random(seed)
+    # Few roads, so most batches update some road more than once; counts and levels out of range included
+    updates = [
+        (rnd.randrange(10), rnd.choice([None, rnd.uniform(-0.5, 1.5)]), rnd.choice([None, rnd.randint(-5, 400)]))
+        for _ in range(rnd.randint(1, 30))
+    ]
+    before = traffic_state()
+    for edge, level, count in updates:
+        graph_manager._update_edge_traffic(edge, level, count)
+    expected = traffic_state()
+
+    graph_manager.CURRENT_VEHICLES[:], graph_manager.CURRENT_CONGESTION[:] = before[0], before[1]
+    with graph_manager._WEIGHTS_LOCK:
+        graph_manager.CURRENT_TRAVEL_TIME[:] = before[2]
+    graph_manager.update_traffic_bulk(*map(list, zip(*updates)))
+    for expected_values, values in zip(expected, traffic_state()):
+        assert np.array_equal(expected_values, values)
@@ -0,0 +1,69 @@
+import random
+
+import numpy as np
+import pytest
+
+from app.core import graph_manager, simulation_manager
+from app.core.simulation_manager import STATE_ARRIVED, STATE_IDLE, STATE_ON_ROUTE
+
+
+def random_fleet(rnd: random.Random, size: int) -> dict:
+    """Kernel arguments for size vehicles on random walks over the loaded map, in every state and part of their route."""
+    routes, rows = [], {name: [] for name in ("time_on_segment", "path_index", "state", "segment", "node", "destination", "path_start", "path_len")}
+    path_used = 0
+    for _ in range(size):
+        node = rnd.randrange(len(graph_manager.IDX_TO_NAME))
+        route = []
+        for _ in range(rnd.randint(0, 12)):
+            edge = rnd.randrange(graph_manager.ROW_PTR[node], graph_manager.ROW_PTR[node + 1])
+            route.append(edge)
+            node = int(graph_manager.COL_IDX[edge])
+        index = rnd.randint(0, len(route))
+        on_road = index < len(route) and rnd.random() < 0.5
+        rows["time_on_segment"].append(rnd.uniform(0, 300) if on_road else 0.0)
+        rows["path_index"].append(index)
+        rows["state"].append(rnd.choice((STATE_IDLE, STATE_ARRIVED)) if rnd.random() < 0.1 else STATE_ON_ROUTE)
+        rows["segment"].append(route[index] if on_road else -1)
+        rows["node"].append(int(graph_manager.EDGE_SRC[route[index]]) if index < len(route) else node)
+        rows["destination"].append(node)
+        rows["path_start"].append(path_used)
+        rows["path_len"].append(len(route))
+        routes.extend(route)
+        path_used += len(route)
+    fleet = {name: np.array(values, dtype=np.float64 if name == "time_on_segment" else np.int64) for name, values in rows.items()}
+    fleet["state"] = fleet["state"].astype(np.int8)
+    fleet["path_edges"] = np.array(routes, dtype=np.int64)
+    # Some roads start with more or fewer vehicles than are on them, as after a manual update
+    fleet["vehicle_counts"] = np.array([rnd.randint(0, 3) for _ in graph_manager.COL_IDX], dtype=np.int64)
+    return fleet
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_numba_and_numpy_kernels_agree(load_grid, seed):
+    if not simulation_manager.HAVE_NUMBA:
+        pytest.skip("numba is not installed")
+    load_grid(6, seed)
+    rnd = random.Random(seed)
+    fleet = random_fleet(rnd, 300)
+    numpy_fleet = {name: values.copy() for name, values in fleet.items()}
+    travel_time = graph_manager.CURRENT_TRAVEL_TIME.copy()
+
+    for _ in range(1000):
+        dt = rnd.choice([1.0, 3.0, 7.0, 40.0])
+        results = []
+        for kernel, arrays in ((simulation_manager._advance_vehicles, fleet), (simulation_manager._advance_vehicles_numpy, numpy_fleet)):
+            count_deltas = np.zeros(len(travel_time), dtype=np.int64)
+            arrived = kernel(
+                len(arrays["state"]), arrays["time_on_segment"], arrays["path_index"], arrays["state"], arrays["segment"],
+                arrays["node"], arrays["destination"], arrays["path_start"], arrays["path_len"], arrays["path_edges"],
+                arrays["vehicle_counts"], travel_time, graph_manager.EDGE_SRC, graph_manager.COL_IDX, dt, count_deltas
+            )
+            results.append((arrived, count_deltas))
+        assert np.array_equal(results[0][0], results[1][0])
+        assert np.array_equal(results[0][1], results[1][1])
+        for name in fleet:
+            assert np.array_equal(fleet[name], numpy_fleet[name]), name
+        if not np.any(fleet["state"] == STATE_ON_ROUTE):
+            break
+    else:
+        pytest.fail("some vehicles never finished their route")
@@ -27,16 +27,18 @@ const MapDisplay = ({ nodes, edges, vehicles = [], roadConditions, svgWidth = 80
             const layoutRadius = Math.min(svgWidth, svgHeight) * 0.40; 
             const padding = NODE_SIZE * 1.5;
 
+            // Normalization bounds are the same for every node, so compute them once per layout
+            const allX = nodes.filter(n => n.x !== undefined).map(n => n.x);
+            const allY = nodes.filter(n => n.y !== undefined).map(n => n.y);
+            const minX = allX.length > 0 ? Math.min(...allX) : 0;
+            const maxX = allX.length > 0 ? Math.max(...allX) : svgWidth;
+            const minY = allY.length > 0 ? Math.min(...allY) : 0;
+            const maxY = allY.length > 0 ? Math.max(...allY) : svgHeight;
+            const rangeX = (maxX - minX) || 1;
+            const rangeY = (maxY - minY) || 1;
+
             nodes.forEach((node, index) => {
                 if (node.x !== undefined && node.y !== undefined) {
-                    const allX = nodes.filter(n => n.x !== undefined).map(n => n.x);
-                    const allY = nodes.filter(n => n.y !== undefined).map(n => n.y);
-                    const minX = allX.length > 0 ? Math.min(...allX) : 0;
-                    const maxX = allX.length > 0 ? Math.max(...allX) : svgWidth;
-                    const minY = allY.length > 0 ? Math.min(...allY) : 0;
-                    const maxY = allY.length > 0 ? Math.max(...allY) : svgHeight;
-                    const rangeX = (maxX - minX) || 1;
-                    const rangeY = (maxY - minY) || 1;
                     newPositions[node.id] = {
                         x: ((node.x - minX) / rangeX) * (svgWidth - padding * 2) + padding,
                         y: ((node.y - minY) / rangeY) * (svgHeight - padding * 2) + padding,